@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Scaling benchmark for MensAmplio effects. Generates synthetic sculptures of
+# increasing size, then times Model startup and the per-frame cost of each layer.
+#
+# Usage: python benchmark_model.py [edges ...]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy
+import led.effects as effects
+from led.model import Model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modeling'))
+import synthesize_sculpture
+
+DEFAULT_SIZES = [234, 1000, 5000, 20000, 100000]
+FRAMES = 20
+
+LAYERS = [
+    ('RGBLayer', lambda model: effects.RGBLayer()),
+    ('TreeColorDrifterLayer', lambda model: effects.TreeColorDrifterLayer([(0,1,0), (0,0,1), (1,0,0)], 5)),
+    ('PlasmaLayer', lambda model: effects.PlasmaLayer()),
+    ('WavesLayer', lambda model: effects.WavesLayer()),
+    ('DigitalRainLayer', lambda model: effects.DigitalRainLayer()),
+    ('ImpulseLayer2', lambda model: effects.ImpulseLayer2()),
+    ('LightningStormLayer', lambda model: effects.LightningStormLayer()),
+    ('RainLayer', lambda model: effects.RainLayer(model)),
+    ('SpotlightLayer', lambda model: effects.SpotlightLayer()),
+    ('GammaLayer', lambda model: effects.GammaLayer(2.2)),
+]
+
+
+def timeLayer(model, layer, frames=FRAMES):
+    """Average seconds per frame to render 'layer' on its own"""
+    params = effects.EffectParameters()
+    params.time = 1000.0
+    frame = numpy.zeros((model.numLEDs, 3))
+    start = time.time()
+    for i in range(frames):
+        params.time += 1.0 / params.targetFrameRate
+        frame[:] = 0
+        layer.render(model, params, frame)
+    return (time.time() - start) / frames
+
+
+def benchmark(edges, workdir):
+    trees, depth, fanout = synthesize_sculpture.parameters_for_edge_count(edges)
+    graphFilename = os.path.join(workdir, 'graph.%d.json' % edges)
+    mappingFilename = os.path.join(workdir, 'remap.%d.json' % edges)
+    synthesize_sculpture.write(graphFilename, mappingFilename, trees, depth, fanout)
+
+    start = time.time()
+    model = Model(graphFilename, mappingFilename)
+    buildTime = time.time() - start
+    start = time.time()
+    model = Model(graphFilename, mappingFilename)
+    cachedTime = time.time() - start
+    print "%d edges (%d trees, depth %d, fan-out %d): Model built in %.3f s, loaded from cache in %.3f s" % (
+        model.numLEDs, trees, depth, fanout, buildTime, cachedTime)
+
+    for name, factory in LAYERS:
+        try:
+            seconds = timeLayer(model, factory(model))
+            print "  %-24s %9.3f ms/frame" % (name, seconds * 1000)
+        except Exception, e:
+            print "  %-24s    failed: %s" % (name, e)
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or DEFAULT_SIZES
+    workdir = tempfile.mkdtemp(prefix='mensamplio-bench-')
+    try:
+        for edges in sizes:
+            benchmark(edges, workdir)
+    finally:
+        shutil.rmtree(workdir)
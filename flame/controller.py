@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+import Queue
+import logging
+import threading
+from flameboard import FlameBoard, openBus
+from scheduler import Lateness, monotonic
+
+
+class BusWorker(threading.Thread):
+    """
+    Does the writes for all the boards on one I2C bus, one at a time, so a slow or
+    retrying transaction only holds up its own bus.
+    """
+    def __init__(self, name):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.queue = Queue.Queue()
+
+    def submit(self, function, *args):
+        """Queues function(*args). Returns a Job to wait on."""
+        job = Job(function, args)
+        self.queue.put(job)
+        return job
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                job.run()
+            except Exception:
+                logging.exception("Job on %s failed" % self.name)
+
+
+class Job:
+    """
+    A write queued on a BusWorker. Anything other than an IOError that goes wrong in it
+    is logged and then reported as an IOError, so callers that stop on a failed write
+    stop on this too instead of dying.
+    """
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except IOError, e:
+            self.error = e
+        except Exception, e:
+            logging.exception("Flame board write failed")
+            self.error = IOError("Flame board write failed: %s" % e)
+        finally:
+            self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class FlameController:
+    """
+    Drives several flame boards, on one or more I2C buses, as one big board. Solenoids
+    are numbered across all the boards in order: with two 6-solenoid boards, 0-5 are
+    the first board's and 6-11 the second's.
+
+    Each bus gets a worker thread. A toggle is split up by board and handed to the
+    workers without waiting, so boards on different buses are written in parallel and
+    a slow bus never holds up the others. A write that failed is raised from the next
+    toggle(). Has the same toggle() and all_off() as FlameBoard, so it can be passed
+    anywhere a board can. Keeps a scheduler.Lateness per board in 'lateness'.
+    """
+    def __init__(self, boards):
+        self.boards = boards
+        self.offsets = []
+        self.numSolenoids = 0
+        for board in boards:
+            self.offsets.append(self.numSolenoids)
+            self.numSolenoids += board.numSolenoids
+        self.lateness = [Lateness() for board in boards]
+        self.pending = []       # Jobs not yet known to have succeeded
+        self.workers = {}       # id(bus) -> BusWorker
+        for board in boards:
+            if id(board.bus) not in self.workers:
+                worker = BusWorker("flame bus %d" % len(self.workers))
+                worker.start()
+                self.workers[id(board.bus)] = worker
+
+    @classmethod
+    def open(cls, layout, bus_factory=None, **transport_options):
+        """
+        Builds a controller from a list of (bus number, address, number of solenoids),
+        opening each bus once. 'bus_factory' makes a bus from its number; by default
+        flameboard.openBus, which uses smbus.SMBus, or pass something that returns a
+        transport.MockSMBus to test.
+        """
+        bus_factory = bus_factory or openBus
+        buses = {}
+        boards = []
+        for bus_number, address, num_solenoids in layout:
+            if bus_number not in buses:
+                buses[bus_number] = bus_factory(bus_number)
+            boards.append(FlameBoard(buses[bus_number], address, num_solenoids, **transport_options))
+        return cls(boards)
+
+    def validIndex(self, index):
+        return index >= 0 and index < self.numSolenoids
+
+    def locate(self, index):
+        """(board number, index on that board) of a global solenoid index"""
+        for b in range(len(self.boards) - 1, -1, -1):
+            if index >= self.offsets[b]:
+                return b, index - self.offsets[b]
+
+    def toggle(self, indices, deadline=None):
+        """
+        Toggles solenoids by global index. Returns the number of indices sent to the
+        boards. Raises the IOError of any earlier toggle that failed.
+        """
+        self._check()
+        local = {}
+        for index in indices:
+            if self.validIndex(index):
+                b, i = self.locate(index)
+                local.setdefault(b, []).append(i)
+        for b in sorted(local):
+            self.pending.append(self._worker(b).submit(self._write, b, local[b], deadline))
+        return sum(len(i) for i in local.values())
+
+    def all_off(self, throw_io_error=False):
+        """
+        Closes all solenoids on every board, once earlier writes are done
+        """
+        self.pending.extend(self._worker(b).submit(board.all_off, True) for b, board in enumerate(self.boards))
+        try:
+            self.flush()
+        except IOError:
+            if throw_io_error: raise
+
+    def flush(self):
+        """Waits for every queued write, and raises the first IOError if any failed"""
+        error = None
+        for job in self.pending:
+            try:
+                job.wait()
+            except IOError, e:
+                error = error or e
+        self.pending = []
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Stops the worker threads"""
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            worker.join()
+
+    def stats(self):
+        """One line of counters per board"""
+        lines = []
+        for b, board in enumerate(self.boards):
+            lines.append("board %d (solenoids %d-%d, address 0x%02x, %s): %s" % (
+                b, self.offsets[b], self.offsets[b] + board.numSolenoids - 1, board.address,
+                self._worker(b).name, board.transport.stats()))
+        return "\n".join(lines)
+
+    def _worker(self, b):
+        return self.workers[id(self.boards[b].bus)]
+
+    def _write(self, b, indices, deadline):
+        # Runs on the bus's worker thread
+        self.boards[b].toggle(indices, deadline)
+        if deadline is not None:
+            self.lateness[b].record(monotonic() - deadline)
+
+    def _check(self):
+        # Forget finished writes, raising the first failure among them
+        pending = []
+        error = None
+        for job in self.pending:
+            if not job.done.is_set():
+                pending.append(job)
+            elif job.error is not None:
+                error = error or job.error
+        self.pending = pending
+        if error is not None:
+            raise error
+
+
+if __name__ == '__main__':
+    # Three boards on two mock buses, one of them slow and flaky, playing the same busy
+    # sequence across all 18 solenoids. The fast bus keeps time regardless.
+    import numpy
+    from sequences import FlameSequence, FlameThread
+    from transport import MockSMBus
+
+    buses = {1: MockSMBus(), 3: MockSMBus(latencySecs=0.002, failureRate=0.05, seed=1)}
+    controller = FlameController.open([(1, 0x04, 6), (1, 0x05, 6), (3, 0x04, 6)], buses.get)
+
+    n = 600
+    rng = numpy.random.RandomState(1)
+    sequence = FlameSequence.fromArrays(rng.randint(0, controller.numSolenoids, n),
+                                        numpy.sort(rng.uniform(0, 5000, n)),
+                                        rng.uniform(20, 200, n), merge=True)
+    thread = FlameThread(sequence, controller)
+    thread.start()
+    thread.join()
+    controller.close()
+    print controller.stats()
+    for b, lateness in enumerate(controller.lateness):
+        print "board %d: %s" % (b, lateness)
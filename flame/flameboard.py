@@ -1,6 +1,18 @@
 #!/usr/bin/env python
 
-import smbus
+try:
+    import smbus
+except ImportError:
+    # Only on the Pi. Pass a transport.MockSMBus to test elsewhere.
+    smbus = None
+from transport import Transport
+
+def openBus(bus_number):
+    """smbus.SMBus(bus_number), or a clear error where smbus isn't installed"""
+    if smbus is None:
+        raise ImportError("smbus isn't installed; install it, or pass bus= "
+                          "(e.g. a transport.MockSMBus) to run without the I2C hardware")
+    return smbus.SMBus(bus_number)
 
 class FlameBoard:
     """
@@ -8,24 +20,29 @@ class FlameBoard:
     configured to interpret each incoming byte as the index of a relay to be
     toggled (with the exception of 0xF which is treated as a signal to 
     turn all solenoids off)
+
+    Writes go through a transport.Transport, which retries transient IOErrors and
+    keeps this board's counters. To drive several boards, see controller.FlameController.
     """
-    def __init__(self):
+    def __init__(self, bus=None, address=0x04, num_solenoids=6, bus_number=1, **transport_options):
         self.write_command = 0x02; # value of linux's #define I2C_FUNC_SMBUS_WRITE_BLOCK_DATA
         # max allowed on board is 16 (15 if 0xf is used as all-off
-        # signal), but we are only using 6.
-        self.numSolenoids = 6 
-        self.bus = smbus.SMBus(1)
-        self.address = 0x04 # must match address in atmega code
+        # signal); the first boards only use 6.
+        self.numSolenoids = num_solenoids
+        self.bus = bus or openBus(bus_number)
+        self.address = address # must match address in atmega code
+        self.transport = Transport(self.bus, **transport_options)
         
-    def toggle(self, indices):
+    def toggle(self, indices, deadline=None):
         """
         Sends command to toggle a list of solenoids. Returns the number of indices that
-        were sent (excludes invalid ones).
+        were sent (excludes invalid ones). 'deadline' is the scheduler.monotonic() time
+        the toggle was due, which bounds how long failed writes are retried.
         """
         indices = [ i for i in indices if self.validIndex(i) ]
         count = len(indices)
         if count:
-            self.bus.write_block_data(self.address, self.write_command, indices)
+            self.transport.write(self.address, self.write_command, indices, deadline)
         return count
         
     def validIndex(self, index):
@@ -36,7 +53,7 @@ class FlameBoard:
         Closes all solenoids
         """
         try:
-            self.bus.write_block_data(self.address, self.write_command, [0xF] )
+            self.transport.write(self.address, self.write_command, [0xF] )
         except IOError:
             if throw_io_error: raise
             else: pass
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import ctypes
+import ctypes.util
+import math
+import os
+import time
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+def _findClockGettime():
+    for name in (ctypes.util.find_library('rt'), ctypes.util.find_library('c'), None):
+        try:
+            function = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        function.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        return function
+    return None
+
+_clock_gettime = _findClockGettime()
+
+def monotonic():
+    """
+    Seconds from an arbitrary starting point, unaffected by changes to the system clock
+    (NTP adjustments on the Pi can step time.time() at any moment). Falls back to
+    time.time() where clock_gettime isn't available.
+    """
+    if _clock_gettime:
+        t = _timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) == 0:
+            return t.tv_sec + t.tv_nsec * 1e-9
+    return time.time()
+
+
+# How long before a deadline to stop sleeping and spin instead. Sleeps on Linux overshoot
+# by tens of microseconds, so this keeps toggles sub-millisecond without burning a core.
+SPIN_SECS = 0.0005
+
+# Longest single sleep while waiting, so a cancel is noticed promptly even if the next
+# deadline is far away
+MAX_WAIT_SECS = 0.02
+
+
+def sleepUntil(deadline, cancelled=None, spinSecs=SPIN_SECS):
+    """
+    Sleeps until monotonic() reaches 'deadline', spinning only for the last 'spinSecs'.
+    Returns False early if the 'cancelled' threading.Event gets set, True otherwise.
+    """
+    while True:
+        if cancelled is not None and cancelled.is_set():
+            return False
+        remaining = deadline - monotonic() - spinSecs
+        if remaining <= 0:
+            break
+        time.sleep(min(remaining, MAX_WAIT_SECS))
+    while monotonic() < deadline:
+        pass
+    return True
+
+
+class Lateness:
+    """
+    Collects how late each toggle went out, in seconds, and summarizes them
+    """
+    def __init__(self):
+        self.samples = []
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def histogram(self, edgesMs=(0.1, 0.25, 0.5, 1, 2, 5, 10, 50)):
+        """
+        Count of samples in each bucket, as a list of (label, count)
+        """
+        edges = list(edgesMs) + [float('inf')]
+        counts = [0] * len(edges)
+        for s in self.samples:
+            ms = s * 1000
+            for i, edge in enumerate(edges):
+                if ms < edge:
+                    counts[i] += 1
+                    break
+        labels = []
+        low = 0
+        for edge in edges:
+            labels.append("%g-%g ms" % (low, edge) if edge != float('inf') else ">= %g ms" % low)
+            low = edge
+        return zip(labels, counts)
+
+    def __str__(self):
+        if not self.samples:
+            return "no toggles"
+        ordered = sorted(self.samples)
+        lines = ["%d toggles, median %.3f ms, worst %.3f ms" % (
+            len(ordered), ordered[len(ordered) // 2] * 1000, ordered[-1] * 1000)]
+        most = max(count for label, count in self.histogram()) or 1
+        for label, count in self.histogram():
+            lines.append("  %-14s %6d %s" % (label, count, '#' * int(math.ceil(40.0 * count / most))))
+        return "\n".join(lines)
+
+
+def cpuSeconds():
+    """User plus system CPU time used by this process so far"""
+    t = os.times()
+    return t[0] + t[1]
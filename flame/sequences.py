@@ -2,9 +2,11 @@ import threading
 import time
 import sys
 import random
+import heapq
+import numpy
 from flameboard import FlameBoard
-from collections import defaultdict
-from itertools import combinations
+from scheduler import Lateness, monotonic, sleepUntil, cpuSeconds
+from transport import coalesce
 
 
 class FlameEvent:
@@ -31,24 +33,131 @@ class FlameEvent:
             )
 
 
-class FlameSequence:
+class FlameSequence(object):
     """
     A sequence of flame events to be displayed together. Checks for event 
     collisions and extracts the timepoints where solenoids need to be toggled.
+
+    Events are checked per solenoid with a sort and a sweep rather than pair by pair,
+    so long sequences validate quickly. With merge=True, events that overlap (or touch)
+    on the same solenoid are combined into one instead of raising.
+
+    The toggles are compiled into sorted arrays: 'times' holds each distinct toggle
+    time, and the indices toggled at times[i] are
+    toggle_indices[toggle_offsets[i]:toggle_offsets[i+1]].
+    """
+    def __init__(self, events, merge=False):
+        count = len(events)
+        self._events = events
+        self._compile(numpy.fromiter((e.index for e in events), int, count),
+                      numpy.fromiter((e.start for e in events), float, count),
+                      numpy.fromiter((e.end for e in events), float, count),
+                      merge)
+
+    @classmethod
+    def fromArrays(cls, indices, starts, durations, merge=False):
+        """
+        Builds a sequence straight from arrays of event indices, starts and durations,
+        without making a FlameEvent for each one
+        """
+        sequence = cls.__new__(cls)
+        sequence._events = None
+        starts = numpy.asarray(starts, dtype=float)
+        sequence._compile(numpy.asarray(indices, dtype=int), starts,
+                          starts + numpy.asarray(durations, dtype=float), merge)
+        return sequence
+
+    def _compile(self, indices, starts, ends, merge):
+        if len(starts) == 0:
+            self.indices = self.toggle_indices = numpy.zeros(0, dtype=int)
+            self.starts = self.ends = self.times = numpy.zeros(0)
+            self.toggle_offsets = numpy.zeros(1, dtype=int)
+            return
+        order = numpy.lexsort((starts, indices))
+        indices, starts, ends = indices[order], starts[order], ends[order]
+
+        # Latest end of any earlier event on the same solenoid. Offsetting each solenoid's
+        # times by a multiple of the whole span lets one running maximum serve them all.
+        span = (ends.max() - starts.min() + 1) if len(starts) else 1
+        offset = (indices - (indices.min() if len(indices) else 0)) * span
+        latestEnd = numpy.maximum.accumulate(ends + offset) - offset
+        sameIndex = numpy.concatenate(([False], indices[1:] == indices[:-1]))
+        overlaps = numpy.zeros(len(starts), dtype=bool)
+        overlaps[1:] = sameIndex[1:] & (starts[1:] <= latestEnd[:-1])
+
+        if overlaps.any():
+            if not merge:
+                i = numpy.flatnonzero(overlaps)[0]
+                # Find the earlier event this one runs into, for the message
+                j = i - 1
+                while ends[j] < starts[i]:
+                    j -= 1
+                raise Exception("Collision between " + str(FlameEvent(indices[j], starts[j], ends[j] - starts[j])) +
+                                " and " + str(FlameEvent(indices[i], starts[i], ends[i] - starts[i])) )
+            # Each run of overlapping events becomes one event, from the first start to
+            # the latest end
+            first = numpy.flatnonzero(~overlaps)
+            last = numpy.append(first[1:], len(starts)) - 1
+            indices, starts, ends = indices[first], starts[first], latestEnd[last]
+            self._events = None
+        self.indices, self.starts, self.ends = indices, starts, ends
+
+        # Every event toggles its solenoid at its start and again at its end. Events are
+        # still in solenoid order, so a stable sort by time leaves ties in solenoid order.
+        times = numpy.column_stack((starts, ends)).ravel()
+        toggled = numpy.repeat(indices, 2)
+        order = numpy.argsort(times, kind='mergesort')
+        times, self.toggle_indices = times[order], toggled[order]
+        groupStarts = numpy.flatnonzero(numpy.concatenate(([True], times[1:] != times[:-1])))
+        self.times = times[groupStarts]
+        self.toggle_offsets = numpy.append(groupStarts, len(times))
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = [ FlameEvent(i, start, end - start) for i, start, end in
+                             zip(self.indices.tolist(), self.starts.tolist(), self.ends.tolist()) ]
+        return self._events
+
+    def toggles(self):
+        """
+        (time, indices) for each toggle time, in order
+        """
+        offsets = self.toggle_offsets.tolist()
+        indices = self.toggle_indices.tolist()
+        for i, t in enumerate(self.times.tolist()):
+            yield t, indices[offsets[i]:offsets[i+1]]
+
+    @property
+    def toggle_times(self):
+        """
+        Dictionary of event times -> indices to be toggled
+        """
+        return dict(self.toggles())
+
+
+def synced_bursts(num_solenoids, burst_duration, ibi, reps=None):
+    """
+    Generates the events of SyncedBursts in time order. Goes on forever if reps is None.
     """
-    def __init__(self, events):
-        self.events = events
-        self.toggle_times = defaultdict(list)
-        
-        # check for collisions
-        for c in combinations(events, 2):
-            if FlameEvent.collides(*c):
-                raise Exception("Collision between " + str(c[0]) + " and " + str(c[1]) )
+    r = 0
+    while reps is None or r < reps:
+        for i in range(num_solenoids):
+            yield FlameEvent(i, (ibi+burst_duration)*r, burst_duration)
+        r += 1
+
 
-        for e in events:
-            # create dictionary of event times -> indices to be toggled
-            self.toggle_times[e.start].append(e.index)
-            self.toggle_times[e.end].append(e.index)
+def sequential_bursts(num_solenoids, burst_duration, reps=None):
+    """
+    Generates the events of SequentialBursts in time order. Goes on forever if reps is None.
+    """
+    indices = range(num_solenoids)
+    random.shuffle(indices)
+    r = 0
+    while reps is None or r < reps:
+        for i in range(num_solenoids):
+            yield FlameEvent(indices[i], burst_duration*(r*num_solenoids+i), burst_duration)
+        r += 1
 
 
 class SyncedBursts(FlameSequence):
@@ -62,8 +171,7 @@ class SyncedBursts(FlameSequence):
         ibi: inter-burst interval (beween end of one and start of next), in ms
         reps: how many bursts
         """
-        events = [ FlameEvent(i, (ibi+burst_duration)*r, burst_duration) for i in range(num_solenoids) for r in range(reps) ]
-        FlameSequence.__init__(self, events)
+        FlameSequence.__init__(self, list(synced_bursts(num_solenoids, burst_duration, ibi, reps)))
 
 
 class SequentialBursts(FlameSequence):
@@ -71,41 +179,153 @@ class SequentialBursts(FlameSequence):
     Fires the solenoids one at a time in a random sequence.
     """
     def __init__(self, num_solenoids, burst_duration, reps):
-        indices = range(num_solenoids)
-        random.shuffle(indices)
-        events = [ FlameEvent(indices[i], burst_duration*(r*num_solenoids+i), burst_duration) for i in range(num_solenoids) for r in range(reps) ]
-        FlameSequence.__init__(self,events)
+        FlameSequence.__init__(self, list(sequential_bursts(num_solenoids, burst_duration, reps)))
+
+
+class FlameStream(object):
+    """
+    A show built from event generators instead of lists, so it can be as long as you
+    like, or endless. Each generator must yield FlameEvents in order of start time; the
+    streams are merged through a heap into one stream of toggles.
+
+    Collisions are checked as events arrive, against the events still open on the same
+    solenoid, so memory stays bounded by how many events overlap in time rather than by
+    the length of the show. With merge=True, colliding events are combined instead.
+
+    Plays in a FlameThread just like a FlameSequence.
+    """
+    def __init__(self, streams, merge=False):
+        self.streams = streams
+        self.merge = merge
+
+    def events(self):
+        """
+        All the streams' events, merged in order of start time
+        """
+        heap = []
+        for n, stream in enumerate(self.streams):
+            stream = iter(stream)
+            for e in stream:
+                heap.append((e.start, n, e, stream))
+                break
+        heapq.heapify(heap)
+        last = None
+        while heap:
+            start, n, e, stream = heap[0]
+            if last is not None and start < last:
+                raise Exception("Event " + str(e) + " is out of order")
+            last = start
+            yield e
+            for e in stream:
+                if e.start < start:
+                    raise Exception("Event " + str(e) + " is out of order")
+                heapq.heapreplace(heap, (e.start, n, e, stream))
+                break
+            else:
+                heapq.heappop(heap)
+
+    def toggles(self):
+        """
+        (time, indices) for each toggle time, in order, like FlameSequence.toggles()
+        """
+        open_events = {}    # index -> [start, end] of the event currently on that solenoid
+        pending = []        # heap of (time, index) toggles that may still get company
+
+        def ready(before):
+            # Toggles earlier than 'before' can't change any more; group them by time
+            while pending and pending[0][0] < before:
+                t = pending[0][0]
+                indices = []
+                while pending and pending[0][0] == t:
+                    indices.append(heapq.heappop(pending)[1])
+                yield t, indices
+
+        for e in self.events():
+            # Events that end before this one starts are finished for good
+            for index, (start, end) in open_events.items():
+                if end < e.start:
+                    heapq.heappush(pending, (end, index))
+                    del open_events[index]
+            for toggle in ready(e.start):
+                yield toggle
+
+            current = open_events.get(e.index)
+            if current is None:
+                open_events[e.index] = [e.start, e.end]
+                heapq.heappush(pending, (e.start, e.index))
+            elif self.merge:
+                current[1] = max(current[1], e.end)
+            else:
+                raise Exception("Collision between " + str(FlameEvent(e.index, current[0], current[1] - current[0])) +
+                                " and " + str(e) )
+
+        for index, (start, end) in open_events.items():
+            heapq.heappush(pending, (end, index))
+        for toggle in ready(float('inf')):
+            yield toggle
 
 
 class FlameThread(threading.Thread):
     """
-    Transmits a flame sequence to the flame effects board
+    Transmits a flame sequence to the flame effects board. Sleeps until each toggle is
+    due instead of spinning, and records how late each one went out in 'lateness'.
+    Toggles due within 'batch_ms' of each other are sent in a single block write.
+
+    Given a triggers.TriggerBus, the sequence is timed in LED time from 'start_time'
+    (default: now), and each toggle goes out with the LED frame showing the same moment.
     """
-    def __init__(self, sequence):
+    def __init__(self, sequence, board=None, batch_ms=1.0, triggers=None, start_time=None):
         threading.Thread.__init__(self)
         self.daemon = True
-        self.board = FlameBoard()
+        self.board = board or FlameBoard()
         self.sequence = sequence
+        self.batch_ms = batch_ms
+        self.triggers = triggers
+        self.start_time = start_time
+        self.lateness = Lateness()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stops the sequence before its next toggle. All solenoids are closed on the way out.
+        """
+        self.cancelled.set()
 
     def run(self):
-        start_time = time.time()
-        for i in sorted(self.sequence.toggle_times.items()):
-            time_secs = float(i[0])/1000 + start_time;
-            while time.time() < time_secs:
-                pass
-            try:
-                self.board.toggle( i[1] )
-            except IOError:
-                sys.stderr.write( "Transmission to flame board failed. Terminating sequence.\n" )
-                break
-        self.board.all_off() #just in case
+        if self.triggers:
+            start_time = self.start_time if self.start_time is not None else self.triggers.now()
+        else:
+            start_time = monotonic()
+        try:
+            for i in coalesce(self.sequence.toggles(), self.batch_ms):
+                time_secs = float(i[0])/1000 + start_time
+                if self.triggers:
+                    frame_time, time_secs = self.triggers.align(time_secs)
+                if not sleepUntil(time_secs, self.cancelled):
+                    break
+                try:
+                    self.board.toggle( i[1], time_secs )
+                except IOError:
+                    sys.stderr.write( "Transmission to flame board failed. Terminating sequence.\n" )
+                    break
+                self.lateness.record(monotonic() - time_secs)
+                if self.triggers:
+                    self.triggers.fired(frame_time, monotonic())
+        finally:
+            self.board.all_off() #just in case
 
 if __name__ == '__main__':
     def run_sequence(sequence):
         t = FlameThread(sequence)
+        cpu = cpuSeconds()
+        start = time.time()
         t.start()
         t.join()
+        print "CPU use %.2f%%" % (100 * (cpuSeconds() - cpu) / (time.time() - start))
+        print t.lateness
 
     run_sequence(SequentialBursts(6, 250, 3))
     time.sleep(0.5)
     run_sequence(SyncedBursts(6, 250, 500, 5))
+    time.sleep(0.5)
+    run_sequence(FlameStream([synced_bursts(6, 250, 500, 3), sequential_bursts(6, 100, 3)], merge=True))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import random
+import time
+from scheduler import monotonic
+
+# Most data bytes SMBus allows in one block write
+MAX_BLOCK = 32
+
+
+class Transport:
+    """
+    Sends block writes to one I2C bus, retrying transient IOErrors. A write that keeps
+    failing is retried until it would go out more than 'maxLatenessSecs' past its
+    deadline (or after 'maxRetries' attempts with no deadline), and then the last error
+    is raised. Counts transactions, bytes, retries and failures as it goes.
+    """
+    def __init__(self, bus, maxRetries=3, maxLatenessSecs=0.02, retryDelaySecs=0.0005):
+        self.bus = bus
+        self.maxRetries = maxRetries
+        self.maxLatenessSecs = maxLatenessSecs
+        self.retryDelaySecs = retryDelaySecs
+        self.transactions = 0
+        self.bytes = 0
+        self.retries = 0
+        self.failures = 0
+        self.busySecs = 0.0     # time spent in write(), for throughput
+
+    def write(self, address, command, data, deadline=None):
+        began = monotonic()
+        try:
+            for start in range(0, len(data), MAX_BLOCK):
+                self._writeBlock(address, command, data[start:start + MAX_BLOCK], deadline)
+        finally:
+            self.busySecs += monotonic() - began
+
+    def _writeBlock(self, address, command, block, deadline):
+        attempt = 0
+        while True:
+            try:
+                self.bus.write_block_data(address, command, block)
+                self.transactions += 1
+                self.bytes += len(block)
+                return
+            except IOError:
+                attempt += 1
+                if deadline is not None:
+                    giveUp = monotonic() + self.retryDelaySecs > deadline + self.maxLatenessSecs
+                else:
+                    giveUp = attempt > self.maxRetries
+                if giveUp:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                time.sleep(self.retryDelaySecs)
+
+    def stats(self):
+        return "%d transactions, %d bytes (%.0f bytes/s busy), %d retries, %d failures" % (
+            self.transactions, self.bytes, self.bytes / self.busySecs if self.busySecs else 0,
+            self.retries, self.failures)
+
+
+def coalesce(toggles, windowMs):
+    """
+    Merges a time-ordered stream of (time, indices) toggles so that everything due within
+    'windowMs' of the first toggle in a group goes out together, at that first time, in
+    one block write. The board handles the bytes of a block in order, so the result is the
+    same as sending them separately, just sooner.
+    """
+    current = None
+    for t, indices in toggles:
+        if current is not None and t - current[0] <= windowMs:
+            current[1].extend(indices)
+        else:
+            if current is not None:
+                yield current[0], current[1]
+            current = (t, list(indices))
+    if current is not None:
+        yield current[0], current[1]
+
+
+class MockSMBus:
+    """
+    In-memory stand-in for smbus.SMBus, for testing and benchmarking flame sequences
+    without a Pi. Each block write takes 'latencySecs' plus 'byteSecs' per byte (the
+    defaults are roughly a 100 kHz bus), and fails with an IOError with probability
+    'failureRate'. Keeps a log of writes and the open/closed state of each solenoid.
+    """
+    def __init__(self, latencySecs=0.0002, byteSecs=0.00009, failureRate=0.0, seed=None):
+        self.latencySecs = latencySecs
+        self.byteSecs = byteSecs
+        self.failureRate = failureRate
+        self.random = random.Random(seed)
+        self.log = []           # (time, address, data) of each successful write
+        self.open = {}          # address -> set of open solenoid indices
+
+    def write_block_data(self, address, command, data):
+        if len(data) > MAX_BLOCK:
+            raise IOError("Block of %d bytes is too long for SMBus" % len(data))
+        duration = self.latencySecs + self.byteSecs * (len(data) + 3)   # plus address, command, count
+        if duration > 0:
+            time.sleep(duration)
+        if self.failureRate and self.random.random() < self.failureRate:
+            raise IOError(121, "Remote I/O error")
+        self.log.append((monotonic(), address, list(data)))
+        state = self.open.setdefault(address, set())
+        for index in data:
+            if index == 0xF:
+                state.clear()
+            else:
+                state.symmetric_difference_update([index])
+
+
+if __name__ == '__main__':
+    # Play a busy sequence against a mock bus with and without batching, and compare
+    from flameboard import FlameBoard
+    from sequences import FlameSequence, FlameThread
+    from scheduler import cpuSeconds
+    import numpy
+
+    n = 300
+    rng = numpy.random.RandomState(1)
+    indices = rng.randint(0, 6, n)
+    starts = numpy.sort(rng.uniform(0, 5000, n))
+    sequence = FlameSequence.fromArrays(indices, starts, rng.uniform(20, 200, n), merge=True)
+
+    for window in (0, 1, 5):
+        bus = MockSMBus(failureRate=0.01, seed=1)
+        thread = FlameThread(sequence, FlameBoard(bus=bus), batch_ms=window)
+        cpu = cpuSeconds()
+        start = time.time()
+        thread.start()
+        thread.join()
+        print "batch window %g ms: %s, CPU %.2f%%" % (
+            window, thread.board.transport.stats(), 100 * (cpuSeconds() - cpu) / (time.time() - start))
+        print thread.lateness
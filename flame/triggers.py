@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+import collections
+import math
+import sys
+import threading
+import time
+from flameboard import FlameBoard
+from scheduler import Lateness, monotonic, sleepUntil, SPIN_SECS, MAX_WAIT_SECS
+
+
+class TriggerBus:
+    """
+    Timestamped cues shared between the LED animation loop and the flame effects.
+
+    Cue times are in the LEDs' timebase, the EffectParameters.time of the frame that
+    should show them, so a layer can post a cue for the frame it's rendering and a
+    parameter source can post one for bus.now(). Subscribers get (time, value) for each
+    cue posted under their name, on the posting thread, so they should only queue it.
+
+    The AnimationController reports each frame it sends with frameShown(). That ties
+    the LED timebase to monotonic() and gives the frame grid, so align() can say when
+    the frame showing a given moment goes out, and a flame scheduler can fire with it.
+    The gap between each flame toggle and its frame is collected in 'skew'.
+
+    'clock' is where the LEDs get their time, the animation's EffectParameters.clock;
+    anything with a time() method, by default the time module.
+    """
+    def __init__(self, latencySecs=0.0, period=1.0/59, clock=None):
+        self.latencySecs = latencySecs  # from sending a frame to the LEDs showing it
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.frameTime = (clock or time).time()     # most recent frame, in LED time
+        self.frameAt = monotonic()      # when it was sent
+        self.period = period            # seconds between frames
+        self.frames = collections.deque(maxlen=64)
+        self.fires = collections.deque(maxlen=64)
+        self.skew = Lateness()
+
+    def subscribe(self, name, callback):
+        """Call 'callback' with (time, value) for each cue posted under 'name'"""
+        self.subscribers.setdefault(name, []).append(callback)
+
+    def post(self, time, name, value=None):
+        for callback in self.subscribers.get(name, ()):
+            callback(time, value)
+
+    def now(self):
+        """The current moment in LED time"""
+        with self.lock:
+            return self.frameTime + monotonic() - self.frameAt
+
+    def frameShown(self, time, period):
+        """Called by the animation loop after sending the frame for LED time 'time'"""
+        at = monotonic()
+        with self.lock:
+            self.frameTime = time
+            self.frameAt = at
+            self.period = period
+            self.frames.append((time, at))
+            self._match()
+
+    def align(self, time):
+        """
+        (frame time, deadline): the first frame at or after LED time 'time', and the
+        monotonic() time it will be showing on the LEDs
+        """
+        with self.lock:
+            return self._align(time)
+
+    def alignAll(self, times):
+        """align() for each of 'times', all against the same frame"""
+        with self.lock:
+            return [self._align(time) for time in times]
+
+    def fired(self, frameTime, at):
+        """Called by the flame scheduler after toggling for the frame at 'frameTime'"""
+        with self.lock:
+            self.fires.append((frameTime, at))
+            self._match()
+
+    def _align(self, time):
+        frames = math.ceil((time - self.frameTime) / self.period - 1e-6)
+        aligned = self.frameTime + frames * self.period
+        return aligned, self.frameAt + aligned - self.frameTime + self.latencySecs
+
+    def _match(self):
+        # Pair up fires with the frame they were aligned to, whichever came first
+        tolerance = self.period / 2
+        unmatched = collections.deque(maxlen=self.fires.maxlen)
+        for frameTime, at in self.fires:
+            for time, shownAt in reversed(self.frames):
+                if abs(time - frameTime) < tolerance:
+                    self.skew.record(abs(at - shownAt - self.latencySecs))
+                    break
+            else:
+                unmatched.append((frameTime, at))
+        self.fires = unmatched
+
+
+class FlameCuePlayer(threading.Thread):
+    """
+    Fires flames for cues posted on a TriggerBus, in step with the LED frames. Each cue
+    under 'name' has the value (indices, duration in seconds). Cues on a solenoid that's
+    already open for another one extend it instead of toggling it shut.
+
+    A cue can arrive any time before it's due; the thread wakes for it straight away
+    rather than finishing its current wait.
+    """
+    def __init__(self, bus, board=None, name='flame'):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.bus = bus
+        self.board = board or FlameBoard()
+        self.lateness = Lateness()
+        self.cancelled = threading.Event()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.posted = []
+        self.intervals = {}     # index -> [start, end] of its upcoming bursts, in LED time
+        self.opened = set()
+        bus.subscribe(name, self.cue)
+
+    def cue(self, time, value):
+        indices, duration = value
+        with self.lock:
+            self.posted.append((time, indices, duration))
+        self.wake.set()
+
+    def cancel(self):
+        """Stops before the next toggle. All solenoids are closed on the way out."""
+        self.cancelled.set()
+        self.wake.set()
+
+    def _drain(self):
+        with self.lock:
+            posted, self.posted = self.posted, []
+        for start, indices, duration in posted:
+            for index in indices:
+                self._add(index, start, start + duration)
+
+    def _add(self, index, start, end):
+        bursts = self.intervals.setdefault(index, [])
+        if index in self.opened and start <= bursts[0][1]:
+            bursts[0][1] = max(bursts[0][1], end)
+            return
+        bursts.append([start, end])
+        bursts.sort()
+        merged = [bursts[0]]
+        for burst in bursts[1:]:
+            if burst[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], burst[1])
+            else:
+                merged.append(burst)
+        self.intervals[index] = merged
+
+    def _next(self):
+        """(frame time, deadline, indices) of the next toggles due, or None"""
+        indices = [index for index, bursts in self.intervals.items() if bursts]
+        times = [self.intervals[index][0][1 if index in self.opened else 0] for index in indices]
+        due = {}
+        for index, frame in zip(indices, self.bus.alignAll(times)):
+            due.setdefault(frame, []).append(index)
+        if not due:
+            return None
+        frame = min(due)
+        return frame[0], frame[1], due[frame]
+
+    def _toggled(self, indices):
+        for index in indices:
+            if index in self.opened:
+                self.opened.remove(index)
+                self.intervals[index].pop(0)
+            else:
+                self.opened.add(index)
+
+    def run(self):
+        try:
+            while not self.cancelled.is_set():
+                self.wake.clear()
+                self._drain()
+                upcoming = self._next()
+                if upcoming is None:
+                    self.wake.wait(MAX_WAIT_SECS)
+                    continue
+                frameTime, deadline, indices = upcoming
+                remaining = deadline - monotonic() - SPIN_SECS
+                if remaining > 0:
+                    self.wake.wait(min(remaining, MAX_WAIT_SECS))
+                    continue
+                if not sleepUntil(deadline, self.cancelled):
+                    break
+                try:
+                    self.board.toggle(indices, deadline)
+                except IOError:
+                    sys.stderr.write( "Transmission to flame board failed. Stopping cues.\n" )
+                    break
+                at = monotonic()
+                self.lateness.record(at - deadline)
+                self.bus.fired(frameTime, at)
+                self._toggled(indices)
+        finally:
+            self.board.all_off() #just in case
+
+
+if __name__ == '__main__':
+    # Stand in for the LED loop with a thread that "sends" frames at 59 FPS, post cues
+    # from it and from another thread, and see how far the flames land from their frames
+    import random
+    from transport import MockSMBus
+
+    bus = TriggerBus()
+    player = FlameCuePlayer(bus, FlameBoard(bus=MockSMBus()))
+    player.start()
+    stop = threading.Event()
+
+    def ledLoop():
+        t = time.time()
+        period = 1.0 / 59
+        frame = 0
+        while not stop.is_set():
+            if frame % 15 == 0:
+                # A layer cueing a burst for the frame it's rendering
+                bus.post(t, 'flame', ([frame % 6], 0.1))
+            sleepUntil(bus.frameAt + period)
+            bus.frameShown(t, period)
+            t += period
+            frame += 1
+
+    leds = threading.Thread(target=ledLoop)
+    leds.start()
+    for i in range(40):
+        # A parameter source cueing bursts a little ahead
+        bus.post(bus.now() + 0.05, 'flame', (random.sample(range(6), 2), random.uniform(0.05, 0.3)))
+        time.sleep(0.125)
+    stop.set()
+    leds.join()
+    player.cancel()
+    player.join()
+    print "Lateness against deadlines:"
+    print player.lateness
+    print "Skew from the frame showing the same moment (one frame is %.1f ms):" % (1000.0 / 59)
+    print bus.skew
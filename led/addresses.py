@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import numpy
+
+def parseAddress(address):
+    """Components of a dotted address or pattern component as integers, or None if any
+       of them isn't written the way a number prints ("1.01", "a.1"). Comparing those as
+       integers would make "1.01" match "1.1", which string comparison never did.
+       """
+    parts = address.split(".")
+    for part in parts:
+        if not part.isdigit() or str(int(part)) != part:
+            return None
+    return [ int(p) for p in parts ]
+
+class AddressIndex(object):
+    """Dotted LED addresses ("tree.branch.branch...") parsed once into an integer table, so
+       that wildcard pattern queries become array operations instead of string matching.
+
+       Row i of 'parts' holds the address components of LED i, padded with -1. LEDs with no
+       address have a row of -1 and never match anything. A pattern has the same form as an
+       address, except that any component may be '*'. Components match exactly as strings
+       would: addresses that aren't plain numbers ("1.01") are left out of the index, and
+       pattern components like "01" match nothing.
+
+       Query results are boolean masks over all LEDs. They're cached by pattern and marked
+       read-only, so it's cheap to ask for the same pattern every frame.
+       """
+
+    def __init__(self, parts):
+        self.parts = numpy.asarray(parts, dtype=int)
+        self.numEdges, self.width = self.parts.shape
+
+        # Depth of each address, zero for the root of a tree. -1 for unaddressed LEDs.
+        self.depth = (self.parts >= 0).sum(axis=1) - 1
+
+        self._parents = None
+        self._masks = {}
+
+    @classmethod
+    def fromMapping(cls, edgeForAddress, numEdges=None):
+        """Build an index from an address -> LED dictionary, like manual.remap.json"""
+        split = [ (int(edge), parseAddress(address)) for address, edge in edgeForAddress.items() ]
+        split = [ (edge, p) for edge, p in split if p is not None ]
+        if numEdges is None:
+            numEdges = max(edge for edge, p in split) + 1 if split else 0
+        width = max(len(p) for edge, p in split) if split else 1
+
+        parts = numpy.empty((numEdges, width), dtype=int)
+        parts.fill(-1)
+        for edge, p in split:
+            parts[edge, :len(p)] = p
+        return cls(parts)
+
+    @property
+    def parents(self):
+        """LED index of each address's parent (the address minus its last component), or -1
+           for roots. If the mapping skips a level, this is the nearest ancestor it does have.
+           """
+        if self._parents is None:
+            rowForPath = dict((tuple(row), edge) for edge, row in enumerate(self.parts.tolist()))
+            parents = numpy.empty(self.numEdges, dtype=int)
+            parents.fill(-1)
+            for edge, row in enumerate(self.parts.tolist()):
+                # Nearest shorter address that exists, in case the mapping skips a level
+                depth = self.depth[edge]
+                while depth > 0 and parents[edge] < 0:
+                    row[depth] = -1
+                    depth -= 1
+                    parents[edge] = rowForPath.get(tuple(row), -1)
+            self._parents = parents
+        return self._parents
+
+    def match(self, pattern, partial=False):
+        """Mask of LEDs whose address matches 'pattern'. If 'partial' is set, also match any
+           address that starts with a match, i.e. all the descendants of matching LEDs.
+           """
+        key = (pattern, partial)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._compile(pattern, partial)
+            mask.setflags(write=False)
+            self._masks[key] = mask
+        return mask
+
+    def matchAny(self, patterns):
+        """Mask of LEDs whose address matches at least one of the patterns"""
+        key = tuple(patterns)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = numpy.zeros(self.numEdges, dtype=bool)
+            for pattern in patterns:
+                numpy.logical_or(mask, self.match(pattern), mask)
+            mask.setflags(write=False)
+            self._masks[key] = mask
+        return mask
+
+    def _compile(self, pattern, partial):
+        patternParts = pattern.split(".")
+        length = len(patternParts)
+        if length > self.width:
+            return numpy.zeros(self.numEdges, dtype=bool)
+
+        if partial:
+            mask = self.depth >= length - 1
+        else:
+            mask = self.depth == length - 1
+
+        for i, part in enumerate(patternParts):
+            if part == '*':
+                continue
+            value = parseAddress(part)
+            if value is None:
+                # Indexed addresses are all plain numbers, so this can't match anything
+                return numpy.zeros(self.numEdges, dtype=bool)
+            numpy.logical_and(mask, self.parts[:,i] == value[0], mask)
+        return mask
+
+    def edges(self, mask):
+        """Convert a mask to an array of LED indices"""
+        return numpy.flatnonzero(mask)
+
+    def children(self, mask):
+        """Mask of LEDs whose parent is in 'mask'"""
+        parents = self.parents
+        hasParent = parents >= 0
+        result = numpy.zeros(self.numEdges, dtype=bool)
+        result[hasParent] = mask[parents[hasParent]]
+        return result
+
+    def descendants(self, mask):
+        """Mask of all LEDs below those in 'mask', not including 'mask' itself"""
+        result = numpy.zeros(self.numEdges, dtype=bool)
+        frontier = self.children(mask)
+        while frontier.any():
+            numpy.logical_or(result, frontier, result)
+            frontier = self.children(frontier)
+        return result
+
+    def ancestors(self, mask):
+        """Mask of all LEDs above those in 'mask', not including 'mask' itself"""
+        result = numpy.zeros(self.numEdges, dtype=bool)
+        frontier = self.parents[numpy.flatnonzero(mask)]
+        frontier = frontier[frontier >= 0]
+        while len(frontier):
+            result[frontier] = True
+            frontier = self.parents[numpy.unique(frontier)]
+            frontier = frontier[frontier >= 0]
+        return result
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Band powers computed on our side from the Mindwave's 512 Hz raw voltages, so effects can
+# follow the EEG several times a second instead of waiting on the headset's once-per-second
+# summary.
+#
+# Usage: python bandpower.py [updates per second]  -- measures CPU cost on this machine
+
+import time
+import numpy
+from clock import RealTimeClock
+
+# Frequency range (Hz) of each band, named and ordered like mindwave.WAVE_NAMES_IN_ORDER.
+# These are the ranges NeuroSky documents for the headset's own band powers.
+BANDS = [
+    ('delta', 0.5, 2.75),
+    ('theta', 3.5, 6.75),
+    ('alpha_low', 7.5, 9.25),
+    ('alpha_high', 10, 11.75),
+    ('beta_low', 13, 16.75),
+    ('beta_high', 18, 29.75),
+    ('gamma_low', 31, 39.75),
+    ('gamma_mid', 41, 49.75),
+]
+
+
+class BandPowers(object):
+    """One analysis of the most recent window of raw samples. 'powers' holds the absolute
+       power in each band, in BANDS order. Each band is also an attribute holding its share
+       of the total, in the range [0, 1].
+       """
+
+    def __init__(self, powers, timestamp):
+        self.powers = powers
+        self.time = timestamp
+        total = powers.sum()
+        self.relative = powers / total if total > 0 else numpy.zeros(len(powers))
+        for i, (name, low, high) in enumerate(BANDS):
+            setattr(self, name, self.relative[i])
+
+    def __str__(self):
+        return " ".join("%s: %.2f" % (name, getattr(self, name)) for name, low, high in BANDS)
+
+
+class BandPowerAnalyzer(object):
+    """Keeps the last 'windowSize' raw samples in a ring buffer and computes band powers with
+       a Hann-windowed FFT every 'sampleRate / updatesPerSecond' samples. Each result is stored
+       in 'latest' and passed to 'listener', if there is one, stamped with the time from
+       'clock' (the animation's EffectParameters.clock, so it matches params.time).
+
+       Samples are written twice, at i and i + windowSize, so the current window is always
+       one contiguous slice and never needs to be rolled or copied into place.
+       """
+
+    def __init__(self, sampleRate=512, windowSize=512, updatesPerSecond=8, listener=None,
+                 clock=None):
+        self.sampleRate = sampleRate
+        self.windowSize = windowSize
+        self.hop = max(1, int(round(sampleRate / float(updatesPerSecond))))
+        self.listener = listener
+        self.clock = clock or RealTimeClock()
+        self.latest = None
+
+        self.buffer = numpy.zeros(2 * windowSize)
+        self.pos = 0
+        self.received = 0
+        self.untilUpdate = self.hop
+
+        self.window = numpy.hanning(windowSize)
+        freqs = numpy.fft.rfftfreq(windowSize, 1.0 / sampleRate)
+        self.bandStart = numpy.searchsorted(freqs, [low for name, low, high in BANDS], 'left')
+        self.bandStop = numpy.searchsorted(freqs, [high for name, low, high in BANDS], 'right')
+
+    def addSample(self, value):
+        n = self.windowSize
+        self.buffer[self.pos] = self.buffer[self.pos + n] = value
+        self.pos = (self.pos + 1) % n
+        self.received += 1
+        self.untilUpdate -= 1
+        if self.untilUpdate <= 0:
+            self.untilUpdate = self.hop
+            if self.received >= n:
+                self.update()
+
+    def addSamples(self, values):
+        """Add a batch of samples, updating at the same points addSample() would"""
+        values = numpy.asarray(values, dtype=float)
+        n = self.windowSize
+        while len(values):
+            # Copy up to the next update or the end of the ring, whichever is first
+            count = min(len(values), self.untilUpdate, n - self.pos)
+            chunk, values = values[:count], values[count:]
+            self.buffer[self.pos:self.pos + count] = chunk
+            self.buffer[self.pos + n:self.pos + n + count] = chunk
+            self.pos = (self.pos + count) % n
+            self.received += count
+            self.untilUpdate -= count
+            if self.untilUpdate <= 0:
+                self.untilUpdate = self.hop
+                if self.received >= n:
+                    self.update()
+
+    def current(self):
+        """The current window of samples, oldest first"""
+        return self.buffer[self.pos:self.pos + self.windowSize]
+
+    def update(self):
+        samples = self.current()
+        spectrum = numpy.fft.rfft((samples - samples.mean()) * self.window)
+        power = numpy.concatenate(([0], numpy.cumsum(spectrum.real ** 2 + spectrum.imag ** 2)))
+        self.latest = BandPowers(power[self.bandStop] - power[self.bandStart], self.clock.time())
+        if self.listener:
+            self.listener(self.latest)
+        return self.latest
+
+
+if __name__ == '__main__':
+    import sys
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    analyzer = BandPowerAnalyzer(updatesPerSecond=rate)
+    seconds = 60
+    samples = numpy.random.normal(0, 300, analyzer.sampleRate * seconds).astype(int)
+
+    start = time.clock()
+    for s in samples:
+        analyzer.addSample(s)
+    perSample = time.clock() - start
+    start = time.clock()
+    analyzer.addSamples(samples)
+    batched = time.clock() - start
+
+    print "%d s of raw data at %g updates/s:" % (seconds, rate)
+    print "  sample by sample: %.2f%% of one CPU" % (100.0 * perSample / seconds)
+    print "  in batches:       %.2f%% of one CPU" % (100.0 * batched / seconds)
+    print "  latest: %s" % analyzer.latest
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import random
+import time
+import numpy
+
+
+class RealTimeClock(object):
+    """The wall clock. Has the same time() and sleep() as the time module, which is all
+       anything needs from a clock.
+       """
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedClock(object):
+    """A clock that only moves when told to. sleep() advances it instantly, so a frame loop
+       driven by this clock runs as fast as the CPU allows, and every run sees exactly the
+       same sequence of timestamps.
+       """
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def seedRandom(seed):
+    """Seed every random number generator the effects use, for repeatable renders"""
+    random.seed(seed)
+    numpy.random.seed(seed)
@@ -39,7 +39,8 @@ class AnimationController(object):
            tell how well we're doing.
            """
 
-        now = time.time()
+        clock = self.params.clock
+        now = clock.time()
         dt = now - self.params.time
         dtIdeal = 1.0 / self.params.targetFrameRate
 
@@ -56,10 +57,11 @@ class AnimationController(object):
 
             self.params.time += dtIdeal
             if dt < dtIdeal:
-                time.sleep(dtIdeal - dt)
+                clock.sleep(dtIdeal - dt)
 
-        # Log frame rate
+        # Log frame rate. This is real frames per second, even if the clock is simulated.
 
+        now = time.time()
         self._fpsFrames += 1
         if now > self._fpsTime + self._fpsLogPeriod:
             fps = self._fpsFrames / (now - self._fpsTime)
@@ -91,6 +93,8 @@ class AnimationController(object):
         pixels = self.renderLayers()
         self.frameToHardwareFormat(pixels)
         self.opc.putPixels(0, pixels)
+        if self.params.triggers:
+            self.params.triggers.frameShown(self.params.time, 1.0 / self.params.targetFrameRate)
 
     def drawingLoop(self):
         """Render frames forever or until keyboard interrupt"""
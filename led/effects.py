@@ -5,8 +5,8 @@ import random
 import noise
 import numpy
 import colorsys
-import time
 import itertools
+from clock import RealTimeClock
 
 
 class EffectParameters(object):
@@ -16,7 +16,10 @@ class EffectParameters(object):
 
     time = 0
     targetFrameRate = 59.0     # XXX: Want to go higher, but gl_server can't keep up!
+    clock = RealTimeClock()    # Source of 'time'. Use a clock.SimulatedClock to render offline.
     eeg = None
+    bandPowers = None          # bandpower.BandPowers, updated several times a second if available
+    triggers = None            # flame.triggers.TriggerBus for cueing the flame effects, if any
 
 
 class EffectLayer(object):
@@ -72,7 +75,7 @@ class HeadsetResponsiveEffectLayer(EffectLayer):
         self.fading_to = None
 
     def render(self, model, params, frame):
-        now = time.time()
+        now = params.time
         response_level = None
         # Update our measurements, if we have a new one
         if params.eeg and params.eeg != self.last_eeg and params.eeg.on:
@@ -145,18 +148,21 @@ class ColorDrifterLayer(EffectLayer):
         l = len(colors)
         if l == 0:
             raise Exception("Can't initialize ColorDrifterLayer with empty color list")
-        if l > 1 and time is None:
+        if l > 1 and switchTime is None:
             raise Exception("ColorDrifterLayer needs a switch time")
         self.colors = numpy.array([ colorsys.rgb_to_hsv(*c) for c in colors ])
         self.active = 0
         self.switchTime = switchTime
-        self.lastSwitch = time.time()
+        # Set by the first render, so the first color lasts a full switchTime
+        self.lastSwitch = None
         
     def _nextIndex(self, index):
         return (index+1) % len(self.colors)
         
     def _updateColor(self, params):
         """ Subclasses should remember to call this at the start of their render methods """
+        if self.lastSwitch is None:
+            self.lastSwitch = params.time
         if len(self.colors) > 1:
             p = self.proportionComplete(params)
             if p >= 1:
@@ -305,12 +311,17 @@ class PlasmaLayer(EffectLayer):
 
 
 class WavesLayer(HeadsetResponsiveEffectLayer):
-    """Occasional wavefronts of light which propagate outward from the base of the tree"""
+    """Occasional wavefronts of light which propagate outward from the base of the tree.
+
+    By default the wave spreads through space, so it can jump between branches that pass
+    close to each other. With follow_wiring=True it travels along the branches instead,
+    using the model's precomputed path length from the roots.
+    """
 
     width = 0.4
     minimum_period = -1 # anything less than pi/2 is just as-fast-as-possible
 
-    def __init__(self, color=(0.5, 0.5, 1), period=15.0, speed=1.5, respond_to='meditation', smooth_response_over_n_secs=5):
+    def __init__(self, color=(0.5, 0.5, 1), period=15.0, speed=1.5, respond_to='meditation', smooth_response_over_n_secs=5, follow_wiring=False):
         super(WavesLayer,self).__init__(respond_to, smooth_response_over_n_secs)
         self.wave_started_at = 0
         self.drawing_wave = False
@@ -318,6 +329,7 @@ class WavesLayer(HeadsetResponsiveEffectLayer):
         self.speed = speed
         self.period = period
         self.maximum_period = period
+        self.follow_wiring = follow_wiring
 
     def render_responsive(self, model, params, frame, response_level):
         # Center of the expanding wavefront
@@ -327,7 +339,8 @@ class WavesLayer(HeadsetResponsiveEffectLayer):
         if center < math.pi/2:
             self.drawing_wave = True
             # Calculate each pixel's position within the pulse, in radians
-            a = model.edgeDistances - center
+            distances = model.pathLengthFromRoot if self.follow_wiring else model.edgeDistances
+            a = distances - center
             numpy.abs(a, a)
             numpy.multiply(a, math.pi/2 / self.width, a)
 
@@ -352,8 +365,8 @@ class ThrobbingBrainStemLayer(WavesLayer):
     Currently doesn't add any new headset-responsivity, but later we could potentially
     make it change the number of levels or the attenuation.
     """
-    def __init__(self, levels=6, period=1, speed=2.5, color=(0.5, 0, 1), respond_to='attention'):
-        super(ThrobbingBrainStemLayer, self).__init__(color=color, period=period, speed=speed, respond_to=respond_to)
+    def __init__(self, levels=6, period=1, speed=2.5, color=(0.5, 0, 1), respond_to='attention', follow_wiring=False):
+        super(ThrobbingBrainStemLayer, self).__init__(color=color, period=period, speed=speed, respond_to=respond_to, follow_wiring=follow_wiring)
         self.levels = levels
         self.modelCache = None
         self.scaleFactors = None
@@ -364,8 +377,9 @@ class ThrobbingBrainStemLayer(WavesLayer):
             self.start = params.time
         if model is not self.modelCache:
             self.modelCache = model
-            normedHeights = 1 - (model.edgeHeight / float(self.levels))
-            normedHeights[normedHeights < 0] = 0
+            heights = model.hopsFromRoot if self.follow_wiring else model.edgeHeight
+            normedHeights = 1 - (heights / float(self.levels))
+            normedHeights[(normedHeights < 0) | (heights < 0)] = 0
             self.scaleFactors = normedHeights.repeat(3).reshape(model.numLEDs,3)
         
         temp = numpy.zeros(frame.shape)
@@ -490,6 +504,7 @@ class ImpulseLayer2(HeadsetResponsiveEffectLayer):
 
             self.loopChance = 0.1
             self.bounceChance = 0.2
+            self.loopPatterns = ("*.*.*.*.*", "*.*.*.*.1.2", "*.*.*.*.2.1")
 
         def _move_to_any_of(self, edges):
             self.previous_edge = self.edge
@@ -520,7 +535,8 @@ class ImpulseLayer2(HeadsetResponsiveEffectLayer):
             if self.motion == 'Loop':
                 in_node, out_node = self._node_incoming_and_outgoing(model)
                 to_edges = [e for e in model.edgeListForNodes[out_node] if e != self.edge]
-                to_edges = [e for e in to_edges if model.addressMatchesAnyP(model.addressForEdge[e], ["*.*.*.*.*", "*.*.*.*.1.2", "*.*.*.*.2.1"])]
+                loop_edges = model.addressIndex.matchAny(self.loopPatterns)
+                to_edges = [e for e in to_edges if loop_edges[e]]
             elif self.motion == 'Out':
                 to_edges = [e for e in to_edges if model.edgeHeight[e] > height]
             elif self.motion == 'In':
@@ -878,6 +894,29 @@ class RainLayer(HeadsetResponsiveEffectLayer):
             d.render(model, params, frame)
 
             
+class SpotlightLayer(EffectLayer):
+    """A few soft spotlights wandering around the sculpture on Lissajous curves. Uses the model's
+       spatial index, so the cost depends on how many LEDs are lit rather than on the LED count.
+       """
+
+    def __init__(self, count=3, radius=0.2, speed=0.15, color=(1, 0.9, 0.6)):
+        self.radius = radius
+        self.speed = speed
+        self.color = numpy.array(color)
+        # Each spotlight gets its own frequency and phase on each axis
+        self.frequencies = numpy.random.uniform(0.5, 1.5, (count, 3))
+        self.phases = numpy.random.uniform(0, math.pi * 2, (count, 3))
+
+    def render(self, model, params, frame):
+        t = params.time * self.speed * math.pi * 2
+        centers = 0.5 + 0.5 * numpy.sin(self.frequencies * t + self.phases)
+        lights, edges, distances = model.spatialIndex.radiusPairs(centers, self.radius)
+
+        # Brightest at the center of each spot, fading to nothing at its edge
+        brightness = 1 - distances / self.radius
+        numpy.add.at(frame, edges, brightness.reshape(-1, 1) * self.color)
+
+
 class WhiteOutLayer(EffectLayer):
     """ Sets everything to white """
     def render(self, model, params, frame):
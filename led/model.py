@@ -1,8 +1,22 @@
 #!/usr/bin/env python
 
+import gc
+import hashlib
 import json
 import math
+import os
+import zipfile
 import numpy
+from addresses import AddressIndex
+from spatial import SpatialIndex
+from topology import GraphDistances, UNREACHABLE, relax
+
+# Bump this whenever the set or meaning of the cached arrays changes
+CACHE_VERSION = 5
+
+def cacheFilenameFor(graph_filename):
+    """Where a Model built from 'graph_filename' keeps its cache by default"""
+    return os.path.splitext(graph_filename)[0] + '.cache.npz'
 
 class Model(object):
     """A model of the physical sculpture. Holds information about the position and
@@ -13,17 +27,43 @@ class Model(object):
        
        The model is initialized using a JSON object which contains 3D positions for each vertex,
        and a list of graph edges which represent the lit segments between these vertices.
-       """
 
-    def __init__(self, graph_filename, mapping_filename):
-        # Raw graph data
-        self.graphData = json.load(open(graph_filename))
+       Everything we derive from the JSON files is also saved to a binary cache next to the
+       graph file (or at 'cache_filename'), keyed by a hash of both input files. Later starts
+       load the cache instead of rebuilding, unless the inputs have changed or 'cache' is False.
+       """
 
+    def __init__(self, graph_filename, mapping_filename, cache=True, cache_filename=None):
+        self.graphFilename = graph_filename
+        self.mappingFilename = mapping_filename
+        self.cacheFilename = cache_filename or cacheFilenameFor(graph_filename)
+        self._graphData = None
+
+        self.cacheKey = self._calculateCacheKey()
+        if cache and self.loadCache(self.cacheFilename):
+            return
+
+        self._build()
+        if cache:
+            try:
+                self.saveCache(self.cacheFilename)
+            except (IOError, OSError):
+                # Read-only install, perhaps. We'll just rebuild next time.
+                pass
+
+    @property
+    def graphData(self):
+        """Raw graph data. Only parsed when needed, since a cached model doesn't use it."""
+        if self._graphData is None:
+            self._graphData = json.load(open(self.graphFilename))
+        return self._graphData
+
+    def _build(self):
         # Edges: Array of node ID 2-tuples. Indices of this array match LED indices.
         self.edges = map(tuple, self._strDictToArray(self.graphData['edges']))
 
         # Manual address data
-        self.edgeForAddress = json.load(open(mapping_filename))
+        self.edgeForAddress = json.load(open(self.mappingFilename))
         self.addressForEdge = {edge: address for address, edge in self.edgeForAddress.items()}
         self.edgeHeight = self._calculateEdgeHeights()
 
@@ -66,6 +106,133 @@ class Model(object):
         # Which tree is each edge on?
         self.edgeTree = self._calculateEdgeTrees()
 
+        # Addresses parsed into an integer table, for fast wildcard queries
+        self.addressIndex = AddressIndex.fromMapping(self.edgeForAddress, self.numLEDs)
+
+        # Grid over the edge centers, for finding the edges near a point
+        self.spatialIndex = SpatialIndex(self.edgeCenters)
+
+        # Distances along the wiring: hop counts between edges, and from the roots outward in
+        #   hops and in normalized length (root base to each edge's center)
+        self.edgeLengths = self._calculateEdgeLengths()
+        neighbors, offsets = self._packLists(self.edgeAdjacency)
+        self.graphDistances = GraphDistances(neighbors, offsets, landmarks=self.roots)
+        self.hopsFromRoot = self._calculateHopsFromRoot()
+        self.pathLengthFromRoot = self._calculatePathLengthFromRoot(neighbors, offsets)
+
+    def _calculateCacheKey(self):
+        digest = hashlib.sha1(str(CACHE_VERSION))
+        for filename in (self.graphFilename, self.mappingFilename):
+            with open(filename, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def saveCache(self, filename):
+        """Write everything derived from the input files to a binary .npz cache.
+           Lists of lists are stored flattened, along with the offset of each list.
+           """
+        if self.edgeHeight.dtype == object or self.edgeTree.dtype == object:
+            # Some edges have no address; skip caching rather than pickling Nones
+            return False
+
+        addresses = sorted(self.edgeForAddress)
+        arrays = dict(
+            version = numpy.array(CACHE_VERSION),
+            key = numpy.array(self.cacheKey),
+            edges = numpy.array(self.edges, dtype=int).reshape(-1, 2),
+            mappingAddresses = numpy.array(addresses),
+            mappingEdges = numpy.array([ self.edgeForAddress[a] for a in addresses ]),
+            edgeHeight = self.edgeHeight,
+            rawNodes = numpy.array(self.rawNodes, dtype=float).reshape(-1, 3),
+            minAABB = numpy.array(self.minAABB, dtype=float),
+            maxAABB = numpy.array(self.maxAABB, dtype=float),
+            nodes = numpy.array(self.nodes, dtype=float).reshape(-1, 3),
+            edgeCenters = self.edgeCenters,
+            roots = self.roots,
+            edgeDistances = self.edgeDistances,
+            edgeTree = self.edgeTree,
+            addressParts = self.addressIndex.parts,
+            edgeLengths = self.edgeLengths,
+            hopsFromRoot = self.hopsFromRoot,
+            pathLengthFromRoot = self.pathLengthFromRoot,
+        )
+        if self.graphDistances.table is not None:
+            arrays['graphDistanceTable'] = self.graphDistances.table
+        else:
+            arrays['graphLandmarkRows'] = self.graphDistances.landmarkTable()
+        for name in ('edgeListForNodes', 'edgeAdjacency', 'outwardAdjacency'):
+            arrays[name + 'Values'], arrays[name + 'Offsets'] = self._packLists(getattr(self, name))
+
+        # Write to a temporary file first, so a crash never leaves a half-written cache behind
+        tempFilename = filename + '.tmp'
+        with open(tempFilename, 'wb') as f:
+            numpy.savez(f, **arrays)
+        os.rename(tempFilename, filename)
+        return True
+
+    def loadCache(self, filename):
+        """Load derived data from a cache written by saveCache(). Returns False, leaving the
+           model untouched, if the cache is missing, unreadable, or made from different inputs.
+           """
+        try:
+            with numpy.load(filename) as cache:
+                if int(cache['version']) != CACHE_VERSION or str(cache['key']) != self.cacheKey:
+                    return False
+                arrays = dict((name, cache[name]) for name in cache.files)
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+            return False
+
+        # Rebuilding the lists below creates a lot of small objects at once, which makes the
+        #   cyclic garbage collector run over and over for nothing. Hold it off until we're done.
+        gcWasEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._restoreArrays(arrays)
+        finally:
+            if gcWasEnabled:
+                gc.enable()
+        return True
+
+    def _restoreArrays(self, arrays):
+        self.edges = map(tuple, arrays['edges'].tolist())
+        self.edgeForAddress = dict(zip(arrays['mappingAddresses'].tolist(), arrays['mappingEdges'].tolist()))
+        self.addressForEdge = {edge: address for address, edge in self.edgeForAddress.items()}
+        self.edgeHeight = arrays['edgeHeight']
+        self.numLEDs = len(self.edges)
+        self.rawNodes = map(tuple, arrays['rawNodes'].tolist())
+        self.minAABB = arrays['minAABB'].tolist()
+        self.maxAABB = arrays['maxAABB'].tolist()
+        self.nodes = arrays['nodes'].tolist()
+        self.edgeCenters = arrays['edgeCenters']
+        self.roots = arrays['roots']
+        self.edgeDistances = arrays['edgeDistances']
+        self.edgeTree = arrays['edgeTree']
+        self.addressIndex = AddressIndex(arrays['addressParts'])
+        self.spatialIndex = SpatialIndex(self.edgeCenters)
+        for name in ('edgeListForNodes', 'edgeAdjacency', 'outwardAdjacency'):
+            setattr(self, name, self._unpackLists(arrays[name + 'Values'], arrays[name + 'Offsets']))
+        self.edgeLengths = arrays['edgeLengths']
+        self.graphDistances = GraphDistances(arrays['edgeAdjacencyValues'], arrays['edgeAdjacencyOffsets'],
+            landmarks=self.roots, table=arrays.get('graphDistanceTable'),
+            landmarkRows=arrays.get('graphLandmarkRows'))
+        self.hopsFromRoot = arrays['hopsFromRoot']
+        self.pathLengthFromRoot = arrays['pathLengthFromRoot']
+
+    @staticmethod
+    def _packLists(lists):
+        lengths = [ len(l) for l in lists ]
+        offsets = numpy.zeros(len(lengths) + 1, dtype=int)
+        numpy.cumsum(lengths, out=offsets[1:])
+        values = numpy.fromiter((v for l in lists for v in l), dtype=int, count=offsets[-1])
+        return values, offsets
+
+    @staticmethod
+    def _unpackLists(values, offsets):
+        # Same construction as the _calculate* methods, so cached and freshly built models match
+        values = values.tolist()
+        offsets = offsets.tolist()
+        return numpy.array([ values[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1) ])
+
     def _calculateEdgeCenters(self):
         result = []
         for n1, n2 in self.edges:
@@ -74,6 +241,29 @@ class Model(object):
             result.append(( (x0+x1)/2, (y0+y1)/2, (z0+z1)/2 ))
         return numpy.array(result)
 
+    def _calculateEdgeLengths(self):
+        nodes = numpy.array(self.nodes).reshape(-1, 3)
+        edges = numpy.array(self.edges, dtype=int).reshape(-1, 2)
+        delta = nodes[edges[:,1]] - nodes[edges[:,0]]
+        return numpy.sqrt((delta * delta).sum(axis=1))
+
+    def _calculateHopsFromRoot(self):
+        # -1 for edges with no path to a root
+        hops = self.graphDistances.hopsFrom(self.roots).astype(int)
+        hops[hops == UNREACHABLE] = -1
+        return hops
+
+    def _calculatePathLengthFromRoot(self, neighbors, offsets):
+        # Stepping between adjacent edges covers half of each one. Edges with no path to a
+        #   root are infinitely far away.
+        initial = numpy.empty(self.numLEDs)
+        initial.fill(numpy.inf)
+        roots = self.roots.astype(int)
+        initial[roots] = self.edgeLengths[roots] / 2
+        owners = numpy.repeat(numpy.arange(self.numLEDs), numpy.diff(offsets))
+        weights = (self.edgeLengths[owners] + self.edgeLengths[neighbors]) / 2
+        return relax(neighbors, offsets, initial, weights)
+
     def _calculateEdgeDistances(self):
         result = []
         for x, y, z in self.edgeCenters:
@@ -141,6 +331,14 @@ class Model(object):
         return result
 
     def addressMatchesAnyP(self, address, patterns):
+        edge = self.edgeForAddress.get(address)
+        if edge is not None and self.addressIndex.depth[int(edge)] >= 0:
+            # Indexed address: look it up in each pattern's precompiled mask
+            for p in patterns:
+                if self.addressIndex.match(p)[int(edge)]:
+                    return p
+            return None
+
         for p in patterns:
           if self.addressMatchesP(address, p):
               return p
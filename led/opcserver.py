@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+"""Lightweight stand-in for an Open Pixel Control server.
+
+Accepts any number of OPC clients, parses 'set pixel colors' (command 0x00) and
+system exclusive (command 0xFF) messages, and measures what arrives: per-frame
+timestamps, inter-frame jitter, throughput, and per-channel pixel counts. Nothing is
+drawn. This lets us run the AnimationController end to end without the LEDs or
+gl_server attached.
+
+The server can also pretend to be a slow receiver, by refusing to read from a client
+for 'frameDelay' seconds after each frame. Combined with a small receive buffer this
+pushes back on the sender through TCP, the same way an overloaded server would.
+
+Usage: python -m led.opcserver [--port 7890] [--frame-delay 0.02]
+"""
+
+import argparse
+import asyncore
+import collections
+import socket
+import struct
+import sys
+import threading
+import time
+import numpy
+
+SET_PIXEL_COLORS = 0x00
+SYSTEM_EXCLUSIVE = 0xFF
+HEADER = struct.Struct('>BBH')
+
+
+class OPCStats(object):
+    """Running measurements of the messages received on one or more OPC connections.
+
+       Arrival times are kept for the most recent 'historyLength' frames; totals
+       cover everything since the first frame. Messages are recorded on the server
+       thread while reports can be made from any other, so both hold 'lock'.
+       """
+
+    def __init__(self, historyLength=10000):
+        self.lock = threading.Lock()
+        self.arrivals = collections.deque(maxlen=historyLength)
+        self.frames = 0
+        self.bytes = 0
+        self.sysexMessages = 0
+        self.firstTime = None
+        self.lastTime = None
+
+        # Channel -> number of pixels in the most recent frame / number of frames seen
+        self.channelPixels = {}
+        self.channelFrames = collections.defaultdict(int)
+
+    def recordMessage(self, channel, command, length, now):
+        with self.lock:
+            if self.firstTime is None:
+                self.firstTime = now
+            self.lastTime = now
+            self.bytes += HEADER.size + length
+
+            if command == SET_PIXEL_COLORS:
+                self.frames += 1
+                self.arrivals.append(now)
+                self.channelPixels[channel] = length // 3
+                self.channelFrames[channel] += 1
+            elif command == SYSTEM_EXCLUSIVE:
+                self.sysexMessages += 1
+
+    def intervals(self):
+        """Seconds between consecutive frames, as an array"""
+        with self.lock:
+            arrivals = list(self.arrivals)
+        return numpy.diff(numpy.array(arrivals))
+
+    def jitter(self):
+        """Standard deviation of the inter-frame interval, in seconds"""
+        intervals = self.intervals()
+        return intervals.std() if len(intervals) else 0.0
+
+    def frameRate(self):
+        intervals = self.intervals()
+        return 1.0 / intervals.mean() if len(intervals) and intervals.mean() > 0 else 0.0
+
+    def byteRate(self):
+        if self.firstTime is None or self.lastTime <= self.firstTime:
+            return 0.0
+        return self.bytes / (self.lastTime - self.firstTime)
+
+    def __str__(self):
+        intervals = self.intervals()
+        worst = intervals.max() * 1000 if len(intervals) else 0.0
+        with self.lock:
+            channelPixels = sorted(self.channelPixels.items())
+        channels = ", ".join("%d: %d px" % (c, n) for c, n in channelPixels)
+        return "%d frames, %7.2f FPS, jitter %.2f ms, worst gap %.2f ms, %.1f kB/s, %d sysex [%s]" % (
+            self.frames, self.frameRate(), self.jitter() * 1000, worst,
+            self.byteRate() / 1024, self.sysexMessages, channels)
+
+
+class OPCConnection(asyncore.dispatcher):
+    """One client connected to an OPCServer. Buffers incoming bytes and parses
+       complete messages out of them as they arrive.
+       """
+
+    def __init__(self, sock, server):
+        asyncore.dispatcher.__init__(self, sock, map=server.socketMap)
+        self.server = server
+        self.stats = OPCStats(server.historyLength)
+        self.buffer = bytearray()
+        self.busyUntil = 0
+
+    def readable(self):
+        # A simulated slow receiver just stops reading for a while. The kernel buffers
+        # fill up and the client's send() eventually blocks.
+        return time.time() >= self.busyUntil
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        data = self.recv(self.server.recvSize)
+        if data:
+            self.buffer.extend(data)
+            self.parseMessages()
+
+    def parseMessages(self):
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            channel, command, length = HEADER.unpack_from(self.buffer, offset)
+            end = offset + HEADER.size + length
+            if end > len(self.buffer):
+                break
+
+            now = time.time()
+            self.stats.recordMessage(channel, command, length, now)
+            self.server.stats.recordMessage(channel, command, length, now)
+            if command == SYSTEM_EXCLUSIVE and length >= 2:
+                systemId = struct.unpack_from('>H', self.buffer, offset + HEADER.size)[0]
+                self.server.sysexSystems[systemId] += 1
+            offset = end
+
+            if self.server.frameDelay and command == SET_PIXEL_COLORS:
+                # Pretend we're busy displaying this frame. Anything else already in
+                # the buffer waits until we're done.
+                self.busyUntil = now + self.server.frameDelay
+                break
+
+        del self.buffer[:offset]
+
+    def parsePending(self):
+        """Parse messages left in our buffer from an earlier read, once we're no longer busy"""
+        if self.buffer and self.readable():
+            self.parseMessages()
+
+    def handle_close(self):
+        self.server.connectionClosed(self)
+        self.close()
+
+
+class OPCServer(asyncore.dispatcher):
+    """Listens for OPC clients and records statistics about what they send.
+
+       'frameDelay' simulates a receiver that needs that many seconds to process each
+       frame. 'recvBufferSize', if given, shrinks the kernel receive buffer on each
+       connection so that backpressure reaches the client sooner.
+
+       Run it in the foreground with serveForever(), or in a daemon thread with start().
+       """
+
+    def __init__(self, host='127.0.0.1', port=7890, frameDelay=0, recvBufferSize=None,
+                 recvSize=65536, historyLength=10000):
+        self.socketMap = {}
+        asyncore.dispatcher.__init__(self, map=self.socketMap)
+        self.frameDelay = frameDelay
+        self.recvBufferSize = recvBufferSize
+        self.recvSize = recvSize
+        self.historyLength = historyLength
+
+        self.stats = OPCStats(historyLength)
+        self.sysexSystems = collections.defaultdict(int)
+        self.connections = []
+        self.closedConnections = []
+        self.running = False
+        self.thread = None
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(16)
+
+        # If port 0 was requested, the OS picked one for us
+        self.host, self.port = self.socket.getsockname()[:2]
+        self.server = '%s:%d' % (self.host, self.port)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is None:
+            return
+        sock, addr = pair
+        if self.recvBufferSize:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recvBufferSize)
+        self.connections.append(OPCConnection(sock, self))
+
+    def connectionClosed(self, connection):
+        if connection in self.connections:
+            self.connections.remove(connection)
+            self.closedConnections.append(connection)
+
+    def serveForever(self, pollInterval=0.005):
+        """Run the event loop until stop() is called"""
+        self.running = True
+        while self.running:
+            asyncore.loop(timeout=pollInterval, map=self.socketMap, count=1)
+            for connection in list(self.connections):
+                connection.parsePending()
+
+    def start(self):
+        """Serve from a daemon thread. Returns immediately."""
+        self.thread = threading.Thread(target=self.serveForever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for connection in list(self.connections):
+            connection.close()
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OPC server stand-in which measures incoming frames")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7890)
+    parser.add_argument('--frame-delay', type=float, default=0,
+                        help="seconds to stall after each frame, to simulate a slow receiver")
+    parser.add_argument('--recv-buffer', type=int, default=None,
+                        help="kernel receive buffer size in bytes, for earlier backpressure")
+    parser.add_argument('--report-every', type=float, default=1.0,
+                        help="seconds between statistics reports")
+    args = parser.parse_args()
+
+    server = OPCServer(args.host, args.port, args.frame_delay, args.recv_buffer).start()
+    sys.stderr.write("Listening on %s\n" % server.server)
+    try:
+        while True:
+            time.sleep(args.report_every)
+            sys.stderr.write("%s\n" % server.stats)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""Headless preview of the sculpture, for reviewing a show without the LEDs or gl_server.
+
+Reads the LED segments from an OPC layout file and draws each frame of LED colors
+as a picture of the sculpture, from a fixed viewpoint. Frames come either from a
+stream of OPC messages, as recorded off the wire (nc -l 7890 > show.opc) or piped
+in live, or from rendering effect layers directly on a simulated clock, which is
+repeatable with --seed.
+
+The geometry never changes, so the projection is worked out once: every pixel the
+segments cover, and which segment is nearest the camera there. Drawing a frame is
+then a single gather of LED colors into the image, which is much faster than real
+time at any sensible size.
+
+Output is a directory of PNGs, or raw RGB frames for piping into a video encoder:
+
+    python -m led.preview --opc show.opc --raw - | \\
+        ffmpeg -f rawvideo -pix_fmt rgb24 -s 640x480 -r 59 -i - show.mp4
+    python -m led.preview --show 60 --layers PlasmaLayer,WavesLayer --seed 1 --png frames/
+"""
+
+import argparse
+import inspect
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy
+from clock import SimulatedClock, seedRandom
+
+OPC_HEADER = struct.Struct('>BBH')
+SET_PIXEL_COLORS = 0x00
+
+
+def loadLayout(filename):
+    """Segments of an OPC layout file, as an array of shape (LEDs, 2, 3). Points are
+       zero-length segments.
+       """
+    segments = []
+    for item in json.load(open(filename)):
+        if 'line' in item:
+            segments.append(item['line'])
+        else:
+            segments.append([item['point'], item['point']])
+    return numpy.array(segments, dtype=float).reshape(-1, 2, 3)
+
+
+class Rasterizer(object):
+    """Projects LED segments into a width x height image, looking horizontally at the
+       sculpture from 'azimuth' degrees around it and 'elevation' degrees above.
+       render() paints a frame of LED colors into the image.
+       """
+
+    def __init__(self, segments, width=640, height=480, azimuth=0.0, elevation=15.0,
+                 thickness=2, margin=0.05, background=(0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.numLEDs = len(segments)
+
+        # Rotate around the vertical axis, then tilt toward the camera. Screen x and y
+        # come from the rotated x and z, and depth is the distance along y.
+        a = math.radians(azimuth)
+        e = math.radians(elevation)
+        yaw = numpy.array([[math.cos(a), -math.sin(a), 0], [math.sin(a), math.cos(a), 0], [0, 0, 1]])
+        tilt = numpy.array([[1, 0, 0], [0, math.cos(e), -math.sin(e)], [0, math.sin(e), math.cos(e)]])
+        points = segments.reshape(-1, 3).dot(yaw.T).dot(tilt.T)
+
+        # Fit the sculpture into the image, keeping its proportions
+        screen = points[:, [0, 2]]
+        low = screen.min(axis=0)
+        extent = numpy.maximum(screen.max(axis=0) - low, 1e-9)
+        scale = min(width * (1 - 2 * margin) / extent[0], height * (1 - 2 * margin) / extent[1])
+        offset = (numpy.array([width, height]) - extent * scale) / 2
+        screen = (screen - low) * scale + offset
+        screen[:, 1] = height - 1 - screen[:, 1]
+        screen = screen.reshape(-1, 2, 2)
+        depth = points[:, 1].reshape(-1, 2)
+
+        # Sample each segment about once per pixel along its length
+        lengths = numpy.sqrt(((screen[:, 1] - screen[:, 0]) ** 2).sum(axis=1))
+        counts = numpy.ceil(lengths).astype(int) + 1
+        owner = numpy.repeat(numpy.arange(self.numLEDs), counts)
+        step = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        t = (step / numpy.maximum(counts - 1, 1)[owner].astype(float))[:, numpy.newaxis]
+        xy = screen[owner, 0] + t * (screen[owner, 1] - screen[owner, 0])
+        z = depth[owner, 0] + t[:, 0] * (depth[owner, 1] - depth[owner, 0])
+
+        # Thicken lines with a square brush
+        spread = numpy.arange(thickness) - (thickness - 1) // 2
+        brush = numpy.array([(dx, dy) for dx in spread for dy in spread])
+        x = (numpy.round(xy[:, 0])[:, numpy.newaxis] + brush[:, 0]).ravel().astype(int)
+        y = (numpy.round(xy[:, 1])[:, numpy.newaxis] + brush[:, 1]).ravel().astype(int)
+        owner = numpy.repeat(owner, len(brush))
+        z = numpy.repeat(z, len(brush))
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        pixel = (y * width + x)[inside]
+        owner = owner[inside]
+        z = z[inside]
+
+        # Where segments overlap, the one nearest the camera (smallest depth) wins
+        order = numpy.lexsort((z, pixel))
+        self.pixels, first = numpy.unique(pixel[order], return_index=True)
+        self.owners = owner[order][first]
+
+        self.image = numpy.empty((height * width, 3), dtype=numpy.uint8)
+        self.image[:] = background
+
+    def render(self, colors):
+        """Draws a frame of LED colors, anything of shape (LEDs, 3) in 0-255, and returns
+           the image, an array of shape (height, width, 3). The same array is reused for
+           every frame. LEDs missing from a short frame are drawn black.
+           """
+        colors = numpy.asarray(colors).reshape(-1, 3)
+        if len(colors) < self.numLEDs:
+            colors = numpy.vstack((colors, numpy.zeros((self.numLEDs - len(colors), 3), colors.dtype)))
+        if colors.dtype != numpy.uint8:
+            colors = numpy.clip(colors, 0, 255).astype(numpy.uint8)
+        self.image[self.pixels] = colors[self.owners]
+        return self.image.reshape(self.height, self.width, 3)
+
+
+def opcFrames(fileobj, channel=0):
+    """Pixel colors of each set-pixel-colors message in an OPC stream, as uint8 arrays of
+       shape (pixels, 3). Messages for other channels are skipped; channel 0 means all.
+       """
+    while True:
+        header = fileobj.read(OPC_HEADER.size)
+        if len(header) < OPC_HEADER.size:
+            return
+        msgChannel, command, length = OPC_HEADER.unpack(header)
+        data = fileobj.read(length)
+        if len(data) < length:
+            return
+        if command == SET_PIXEL_COLORS and (channel == 0 or msgChannel in (0, channel)):
+            yield numpy.frombuffer(data, dtype=numpy.uint8, count=length - length % 3).reshape(-1, 3)
+
+
+def showFrames(model, renderer, seconds, fps, seed=None):
+    """Frames of LED colors from rendering effect layers on a simulated clock, one every
+       1/fps seconds of show time, converted to 0-255 as AnimationController does.
+       """
+    if seed is not None:
+        seedRandom(seed)
+    from effects import EffectParameters
+    params = EffectParameters()
+    params.clock = SimulatedClock()
+    params.targetFrameRate = fps
+    frame = numpy.zeros((model.numLEDs, 3))
+    for i in xrange(int(round(seconds * fps))):
+        # Each frame's time is computed, not accumulated, so it never drifts off the grid
+        params.clock.now = i / float(fps)
+        params.time = params.clock.time()
+        frame[:] = 0
+        renderer.render(model, params, frame)
+        numpy.multiply(frame, 255, frame)
+        yield frame
+
+
+def writePNG(filename, image):
+    """Saves an RGB image array of shape (height, width, 3) as a PNG"""
+    height, width = image.shape[:2]
+    rows = numpy.zeros((height, 1 + width * 3), dtype=numpy.uint8)   # filter byte 0 per row
+    rows[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    with open(filename, 'wb') as f:
+        f.write('\x89PNG\r\n\x1a\n')
+        f.write(chunk('IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk('IDAT', zlib.compress(rows.tostring(), 1)))
+        f.write(chunk('IEND', ''))
+
+
+def makeLayers(names, model):
+    """Effect layers from a comma-separated list of class names in led.effects, built
+       with their default settings
+       """
+    import effects
+    layers = []
+    for name in names.split(','):
+        cls = getattr(effects, name)
+        args = inspect.getargspec(cls.__init__).args if cls.__init__ is not object.__init__ else []
+        layers.append(cls(model) if 'model' in args else cls())
+    return layers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Draws LED frames as pictures of the sculpture")
+    parser.add_argument('--layout', default='modeling/opc-layout.json')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--opc', metavar='FILE', help="OPC message stream to draw, or - for stdin")
+    source.add_argument('--show', type=float, metavar='SECONDS', help="render effect layers for this long")
+    parser.add_argument('--layers', default='PlasmaLayer', help="effect classes for --show, comma-separated")
+    parser.add_argument('--graph', default='modeling/graph.data.json', help="model graph for --show")
+    parser.add_argument('--mapping', default='modeling/manual.remap.json', help="model addresses for --show")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for a repeatable --show")
+    parser.add_argument('--fps', type=float, default=59.0, help="frame rate of the show, by default the animation's")
+    parser.add_argument('--size', default='640x480', help="image size, WIDTHxHEIGHT")
+    parser.add_argument('--azimuth', type=float, default=0.0, help="degrees around the sculpture")
+    parser.add_argument('--elevation', type=float, default=15.0, help="degrees above the horizon")
+    parser.add_argument('--thickness', type=int, default=2, help="line width in pixels")
+    parser.add_argument('--every', type=int, default=1, help="only draw every Nth frame")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--png', metavar='DIR', help="write frame00000.png, ... into DIR")
+    output.add_argument('--raw', metavar='FILE', help="write raw RGB24 frames to FILE, or - for stdout")
+    args = parser.parse_args()
+
+    width, height = [int(v) for v in args.size.split('x')]
+    rasterizer = Rasterizer(loadLayout(args.layout), width, height,
+                            args.azimuth, args.elevation, args.thickness)
+
+    if args.opc:
+        frames = opcFrames(sys.stdin if args.opc == '-' else open(args.opc, 'rb'))
+    else:
+        from model import Model
+        from renderer import Renderer
+        model = Model(args.graph, args.mapping)
+        frames = showFrames(model, Renderer(makeLayers(args.layers, model)), args.show, args.fps, args.seed)
+
+    if args.png and not os.path.isdir(args.png):
+        os.makedirs(args.png)
+    raw = None
+    if args.raw:
+        raw = sys.stdout if args.raw == '-' else open(args.raw, 'wb')
+
+    start = time.time()
+    drawn = 0
+    for i, colors in enumerate(frames):
+        if i % args.every:
+            continue
+        image = rasterizer.render(colors)
+        if args.png:
+            writePNG(os.path.join(args.png, 'frame%05d.png' % drawn), image)
+        elif raw:
+            raw.write(buffer(image))
+        drawn += 1
+    if raw and raw is not sys.stdout:
+        raw.close()
+
+    elapsed = time.time() - start
+    showSecs = drawn * args.every / args.fps
+    sys.stderr.write("%d frames (%.1f s of show) in %.2f s, %.1fx real time\n" % (
+        drawn, showSecs, elapsed, showSecs / elapsed if elapsed else float('inf')))
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import time
 import numpy
 from led.effects import GammaLayer
 
@@ -60,12 +59,12 @@ class LinearFade(Fade):
         self.start = None
         
     def render(self, model, params, frame):
-        if not self.start:
-            self.start = time.time()
+        if self.start is None:
+            self.start = params.time
         # render the end layers
         for layer in self.endLayers:
             layer.render(model, params, frame)
-        percentDone = (time.time() - self.start) / self.duration
+        percentDone = (params.time - self.start) / self.duration
         if percentDone >= 1:
             self.done = True
         else:
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+#
+# One background thread that hosts every input source (headset, pulse sensor, whatever comes
+# next) instead of one polling thread each.
+#
+# Sources are generator functions. They yield what they're waiting for, Sleep(seconds) or
+# Readable(socket), and the event loop resumes them when it happens. They report values with
+# runtime.publish(name, value), which stores the value on the shared EffectParameters and
+# passes it to anyone who subscribed to that name. Cancelling a source closes its generator,
+# so its 'finally' blocks run and it can release whatever it holds.
+
+import errno
+import fcntl
+import heapq
+import itertools
+import logging
+import os
+import select
+import threading
+import time
+
+
+class Sleep(object):
+    """Yielded by a source to be resumed after 'seconds'"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Readable(object):
+    """Yielded by a source to be resumed once 'fileobj' has data to read"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+
+class Task(object):
+    """A source running on the event loop"""
+
+    def __init__(self, runtime, generator, name):
+        self.runtime = runtime
+        self.generator = generator
+        self.name = name
+        self.done = False
+
+    def cancel(self):
+        """Stop the source. Safe to call from any thread."""
+        self.runtime.callSoon(self.runtime._finish, self)
+
+    def __repr__(self):
+        return "<Task %s%s>" % (self.name, " (done)" if self.done else "")
+
+
+class Runtime(object):
+    """Runs sources as generators on a single select() loop in a daemon thread.
+
+       The loop sleeps until the next timer is due or a watched socket becomes readable.
+       Calls from other threads (start(), cancel(), stop(), callSoon()) are queued and the
+       loop is woken through a pipe, so nothing else needs locking. Once stop() has been
+       called they're ignored, and the pipe is closed when the loop ends.
+       """
+
+    def __init__(self, params=None):
+        self.params = params
+        self.subscribers = {}
+        self.tasks = set()
+        self.timers = []        # heap of (when, sequence, task)
+        self.readers = {}       # fileobj -> task
+        self.sequence = itertools.count()
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        # A full pipe already means a wakeup is on its way, so never block writing to it
+        for fd in (self.wakeRead, self.wakeWrite):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.running = False
+        self.stopped = False    # set under 'lock' once the wake pipe may be closed
+        self.thread = None
+
+    def subscribe(self, name, callback):
+        """Call 'callback' with each value published under 'name'. Runs on the loop thread."""
+        self.subscribers.setdefault(name, []).append(callback)
+
+    def publish(self, name, value):
+        """Store a value on the parameters object and fan it out to subscribers"""
+        if self.params is not None:
+            setattr(self.params, name, value)
+        for callback in self.subscribers.get(name, ()):
+            try:
+                callback(value)
+            except Exception:
+                logging.exception("Subscriber to %r failed" % name)
+
+    def callSoon(self, function, *args):
+        """Run 'function' on the loop thread as soon as possible"""
+        with self.lock:
+            if self.stopped:
+                # Nothing will run it; the loop has gone and the pipe may be closed
+                return
+            self.pending.append((function, args))
+            try:
+                os.write(self.wakeWrite, 'x')
+            except OSError, e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def spawn(self, generator, name=None):
+        """Add a source, given as a started-but-not-run generator. Returns its Task."""
+        task = Task(self, generator, name or getattr(generator, '__name__', 'source'))
+        self.callSoon(self._step, task)
+        return task
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Cancel every source, let them clean up, and end the loop thread"""
+        if self.thread is None:
+            # Never started, so there's no loop to do it
+            self._shutdown()
+            self.close()
+            return
+        self.callSoon(self._shutdown)
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def close(self):
+        """Release the wake pipe. After this, callSoon() and cancel() do nothing.
+           The loop does this itself when it stops.
+           """
+        with self.lock:
+            self.stopped = True
+            if self.wakeRead is not None:
+                os.close(self.wakeRead)
+                os.close(self.wakeWrite)
+                self.wakeRead = self.wakeWrite = None
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.time())
+            else:
+                timeout = None
+            try:
+                ready = select.select([self.wakeRead] + list(self.readers), [], [], timeout)[0]
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fileobj in ready:
+                if fileobj == self.wakeRead:
+                    os.read(self.wakeRead, 4096)
+                    self._runPending()
+                else:
+                    task = self.readers.pop(fileobj, None)
+                    if task:
+                        self._step(task)
+
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                when, sequence, task = heapq.heappop(self.timers)
+                if not task.done:
+                    self._step(task)
+        self.close()
+
+    def _runPending(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for function, args in pending:
+            function(*args)
+
+    def _step(self, task):
+        """Resume a source until it waits on something again"""
+        if task.done:
+            return
+        self.tasks.add(task)
+        try:
+            waitingFor = task.generator.next()
+        except StopIteration:
+            self._finish(task)
+            return
+        except Exception:
+            logging.exception("Source %s failed" % task.name)
+            self._finish(task)
+            return
+
+        if isinstance(waitingFor, Readable):
+            self.readers[waitingFor.fileobj] = task
+        elif isinstance(waitingFor, Sleep):
+            heapq.heappush(self.timers, (time.time() + waitingFor.seconds, self.sequence.next(), task))
+        else:
+            # A bare yield just gives other sources a turn
+            heapq.heappush(self.timers, (time.time(), self.sequence.next(), task))
+
+    def _finish(self, task):
+        if task.done:
+            return
+        task.done = True
+        self.tasks.discard(task)
+        for fileobj, waiting in self.readers.items():
+            if waiting is task:
+                del self.readers[fileobj]
+        try:
+            task.generator.close()
+        except Exception:
+            logging.exception("Source %s failed while closing" % task.name)
+
+    def _shutdown(self):
+        with self.lock:
+            self.stopped = True
+        for task in list(self.tasks):
+            self._finish(task)
+        self.running = False
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# Input sources for runtime.Runtime. Each one is a generator function taking the runtime as
+# its first argument; start one with runtime.spawn(source(runtime, ...)).
+
+import logging
+import time
+from runtime import Sleep, Readable
+from threads import HeadsetThread
+
+
+def headsetSource(runtime, headset, analyzer=None, retrySecs=5):
+    """Reads a BluetoothHeadset (or TCPHeadset) whenever its socket has data, publishing an
+       EEGInfo as 'eeg' for each complete datapoint. If a bandpower.BandPowerAnalyzer is
+       given, it's fed the raw voltages and its results are published as 'bandPowers',
+       timed by the runtime's parameters' clock.
+
+       Reconnects if the connection drops. Connecting itself still blocks the loop for as
+       long as the headset library takes.
+       """
+    if analyzer:
+        if runtime.params is not None:
+            analyzer.clock = runtime.params.clock
+        analyzer.listener = lambda bandPowers: runtime.publish('bandPowers', bandPowers)
+        headset.rawListener = analyzer.addSample
+    try:
+        while True:
+            if not headset.socket and not headset.tryConnect():
+                yield Sleep(retrySecs)
+                continue
+            yield Readable(headset.socket)
+            try:
+                points = headset.readAvailable()
+            except IOError, e:
+                # bluetooth.BluetoothError is an IOError too
+                logging.error("Lost the headset: %s" % str(e))
+                headset.disconnect()
+                continue
+            for point in points:
+                runtime.publish('eeg', HeadsetThread.EEGInfo(point))
+    finally:
+        if headset.socket:
+            headset.disconnect()
+
+
+def fakePulseSource(runtime, ipiSecs=1.0, intervalSecs=0.05):
+    """Pretends to poll a pulse sensor, publishing 'pulseHigh' while a beat is happening"""
+    start = time.time()
+    while True:
+        elapsed = time.time() - start
+        # let's just pretend that the ECG r-wave spike has a duration of
+        # 1/8 of the beat cycle
+        runtime.publish('pulseHigh', (elapsed % ipiSecs) < (ipiSecs/8))
+        yield Sleep(intervalSecs)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import math
+import numpy
+
+class SpatialIndex(object):
+    """A uniform grid over a set of 3D points, for finding the points near a location without
+       scanning all of them. Model builds one over its edge centers, in normalized coordinates.
+
+       Points are sorted by grid cell, so each cell's points are a contiguous slice of 'order'.
+       Queries look only at the cells that overlap the region of interest, and they take many
+       query locations at once so the work stays inside NumPy.
+       """
+
+    def __init__(self, points, pointsPerCell=4, maxResolution=128):
+        self.points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+        n = len(self.points)
+
+        if n:
+            self.lower = self.points.min(axis=0)
+            self.upper = self.points.max(axis=0)
+        else:
+            self.lower = self.upper = numpy.zeros(3)
+        extent = self.upper - self.lower
+
+        # Cubic cells, sized so there are about 'pointsPerCell' points per cell on average
+        resolution = max(1, min(maxResolution, int(math.ceil((n / float(pointsPerCell)) ** (1/3.0)))))
+        self.cellSize = (extent.max() / resolution) or 1.0
+        self.dims = (numpy.floor(extent / self.cellSize) + 1).astype(int)
+        self.numCells = int(numpy.prod(self.dims))
+
+        cells = self._cellIds(self._cellCoords(self.points))
+        self.order = numpy.argsort(cells, kind='mergesort')
+        self.cellStart = numpy.searchsorted(cells[self.order], numpy.arange(self.numCells + 1))
+
+    def _cellCoords(self, points):
+        return numpy.floor((points - self.lower) / self.cellSize).astype(int)
+
+    def _cellIds(self, coords):
+        return numpy.ravel_multi_index(coords.T, self.dims, mode='clip')
+
+    def _gather(self, owners, cells):
+        """Expand (owner, cell) pairs into (owner, point) pairs for every point in each cell"""
+        starts = self.cellStart[cells]
+        lengths = self.cellStart[cells + 1] - starts
+        total = lengths.sum()
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(total) + numpy.repeat(starts - (ends - lengths), lengths)
+        return numpy.repeat(owners, lengths), self.order[positions]
+
+    def radiusPairs(self, centers, radius):
+        """Find every point within 'radius' of any of the 'centers'. 'radius' may be a single
+           number or one per center.
+
+           Returns three arrays of equal length: the index of the center, the index of the
+           point, and the distance between them.
+           """
+        centers = numpy.asarray(centers, dtype=float).reshape(-1, 3)
+        radius = numpy.broadcast_to(numpy.asarray(radius, dtype=float), (len(centers),))
+        if not len(centers) or not len(self.points):
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int), numpy.zeros(0)
+
+        # Cells within this many steps of the center's own cell can hold a point in range
+        span = int(math.ceil(radius.max() / self.cellSize))
+        if (2*span + 1) ** 3 >= self.numCells:
+            # The query covers the whole grid anyway, so just test every point
+            owners = numpy.repeat(numpy.arange(len(centers)), len(self.points))
+            points = numpy.tile(numpy.arange(len(self.points)), len(centers))
+        else:
+            steps = numpy.arange(-span, span + 1)
+            offsets = numpy.array(numpy.meshgrid(steps, steps, steps, indexing='ij')).reshape(3, -1).T
+            coords = self._cellCoords(centers)[:, numpy.newaxis, :] + offsets[numpy.newaxis, :, :]
+            valid = ((coords >= 0) & (coords < self.dims)).all(axis=2)
+            owners = numpy.nonzero(valid)[0]
+            owners, points = self._gather(owners, self._cellIds(coords[valid]))
+
+        delta = self.points[points] - centers[owners]
+        distances = numpy.sqrt((delta * delta).sum(axis=1))
+        keep = distances <= radius[owners]
+        return owners[keep], points[keep], distances[keep]
+
+    def withinRadius(self, center, radius):
+        """Indices of the points within 'radius' of a single center, in ascending order"""
+        owners, points, distances = self.radiusPairs(center, radius)
+        return numpy.sort(points)
+
+    def radiusMask(self, centers, radius):
+        """Boolean mask of the points within 'radius' of any of the centers"""
+        mask = numpy.zeros(len(self.points), dtype=bool)
+        mask[self.radiusPairs(centers, radius)[1]] = True
+        return mask
+
+    def nearest(self, locations, k=1):
+        """The 'k' nearest points to each location.
+
+           Returns (indices, distances), each shaped (len(locations), k) and sorted from nearest
+           to farthest. If there are fewer than k points, missing entries are -1 and infinity.
+           """
+        locations = numpy.asarray(locations, dtype=float).reshape(-1, 3)
+        m = len(locations)
+        indices = numpy.empty((m, k), dtype=int)
+        indices.fill(-1)
+        distances = numpy.empty((m, k))
+        distances.fill(numpy.inf)
+        wanted = min(k, len(self.points))
+        if not wanted:
+            return indices, distances
+
+        # Start with a ball that should hold about k points, and grow it for any location that
+        # came up short. Everything inside the ball is found, so once it holds k points, those
+        # include the k nearest.
+        density = len(self.points) / float(self.numCells)
+        radius = self.cellSize * max(1.0, (wanted / density) ** (1/3.0))
+        far = numpy.maximum(numpy.abs(locations - self.lower), numpy.abs(locations - self.upper))
+        reach = numpy.sqrt((far * far).sum(axis=1))
+        pending = numpy.arange(m)
+
+        while len(pending):
+            owners, points, dist = self.radiusPairs(locations[pending], radius)
+            counts = numpy.bincount(owners, minlength=len(pending))
+            done = (counts >= wanted) | (reach[pending] <= radius)
+
+            keep = done[owners]
+            owners, points, dist = owners[keep], points[keep], dist[keep]
+            order = numpy.lexsort((dist, owners))
+            owners, points, dist = owners[order], points[order], dist[order]
+            groupStart = numpy.searchsorted(owners, owners)
+            rank = numpy.arange(len(owners)) - groupStart
+            keep = rank < k
+            indices[pending[owners[keep]], rank[keep]] = points[keep]
+            distances[pending[owners[keep]], rank[keep]] = dist[keep]
+
+            pending = pending[~done]
+            radius *= 2
+        return indices, distances
+
+    def box(self, lower, upper):
+        """Indices of the points inside the axis-aligned box from 'lower' to 'upper', in
+           ascending order
+           """
+        lower = numpy.asarray(lower, dtype=float)
+        upper = numpy.asarray(upper, dtype=float)
+        low = numpy.maximum(self._cellCoords(lower), 0)
+        high = numpy.minimum(self._cellCoords(upper), self.dims - 1)
+        if (high < low).any():
+            return numpy.zeros(0, dtype=int)
+
+        axes = [ numpy.arange(low[i], high[i] + 1) for i in range(3) ]
+        coords = numpy.array(numpy.meshgrid(*axes, indexing='ij')).reshape(3, -1).T
+        owners, points = self._gather(numpy.zeros(len(coords), dtype=int), self._cellIds(coords))
+        p = self.points[points]
+        inside = ((p >= lower) & (p <= upper)).all(axis=1)
+        return numpy.sort(points[inside])
@@ -37,9 +37,22 @@ class HeadsetThread(ParamThread):
         def __str__(self):
             return "A: {0} M: {1} Signal: {2}".format(self.attention, self.meditation, self.poor_signal) 
 
-    def __init__(self, params, headset):
+    def __init__(self, params, headset, analyzer=None):
+        """
+        If a bandpower.BandPowerAnalyzer is given, it's fed the headset's raw voltages
+        and its results are stored in params.bandPowers as they come in, timed by
+        params.clock.
+        """
         super(HeadsetThread,self).__init__(params)
         self.headset = headset
+        self.analyzer = analyzer
+        if analyzer:
+            analyzer.clock = params.clock
+            analyzer.listener = self.storeBandPowers
+            headset.rawListener = analyzer.addSample
+
+    def storeBandPowers(self, bandPowers):
+        self.params.bandPowers = bandPowers
 
     def run(self):
         while True:
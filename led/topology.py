@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import numpy
+
+# Hop count stored in distance tables for pairs of edges with no path between them
+UNREACHABLE = 0xFFFF
+
+
+def relax(neighbors, offsets, initial, weights=None):
+    """Shortest distances through a graph stored in compressed rows: the neighbors of node i
+       are neighbors[offsets[i]:offsets[i+1]]. 'initial' holds the starting distance of each
+       node (infinity for nodes that aren't sources). 'weights' gives the cost of stepping along
+       each neighbor entry, or 1 per step if it's None.
+
+       Every node takes the best of its neighbors at once, over and over until nothing changes,
+       so this runs in about as many passes as the graph is hops across.
+       """
+    dist = numpy.array(initial, dtype=float)
+    counts = numpy.diff(offsets)
+    rows = numpy.flatnonzero(counts)
+    if not len(rows):
+        return dist
+    starts = offsets[rows]
+    if weights is None:
+        weights = numpy.ones(len(neighbors))
+
+    while True:
+        candidates = dist[neighbors] + weights
+        best = numpy.minimum.reduceat(candidates, starts)
+        improved = best < dist[rows]
+        if not improved.any():
+            return dist
+        dist[rows[improved]] = best[improved]
+
+
+class GraphDistances(object):
+    """Hop distances between edges of the sculpture, counted along the wiring rather than
+       through space.
+
+       Small sculptures get a complete table of every pair, stored as uint8 when the graph
+       is narrow enough and uint16 otherwise. Larger ones keep a uint16 row for each of a set
+       of landmark edges (the model passes its roots), built once by landmarkTable() and
+       passed back in as 'landmarkRows' when loading from a cache. Distances from anywhere
+       else are computed by breadth-first search and remembered for next time.
+       """
+
+    def __init__(self, neighbors, offsets, landmarks=(), table=None, landmarkRows=None,
+                 maxAllPairs=2048, cacheSize=64):
+        self.neighbors = numpy.asarray(neighbors, dtype=int)
+        self.offsets = numpy.asarray(offsets, dtype=int)
+        self.numEdges = len(self.offsets) - 1
+        self.landmarks = [ int(l) for l in landmarks ]
+        self.maxAllPairs = maxAllPairs
+        self.cacheSize = cacheSize
+        self._table = table
+        self._rows = {}
+        if landmarkRows is not None:
+            for landmark, row in zip(self.landmarks, landmarkRows):
+                row.setflags(write=False)
+                self._rows[(landmark,)] = row
+
+    def _expand(self, owners, edges):
+        """Step from each edge to all of its neighbors, carrying along who started there"""
+        starts = self.offsets[edges]
+        lengths = self.offsets[edges + 1] - starts
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(ends[-1] if len(ends) else 0) + numpy.repeat(starts - (ends - lengths), lengths)
+        return numpy.repeat(owners, lengths), self.neighbors[positions]
+
+    def hopsFrom(self, sources):
+        """Breadth-first search from one or more edges at once. Returns each edge's hop count
+           to the nearest source as uint16, with UNREACHABLE where there's no path.
+           """
+        dist = numpy.empty(self.numEdges, dtype=numpy.uint16)
+        dist.fill(UNREACHABLE)
+        frontier = numpy.unique(numpy.asarray(sources, dtype=int).reshape(-1))
+        dist[frontier] = 0
+        level = 0
+        while len(frontier):
+            level += 1
+            owners, neighbors = self._expand(frontier, frontier)
+            frontier = numpy.unique(neighbors[dist[neighbors] == UNREACHABLE])
+            dist[frontier] = level
+        return dist
+
+    @property
+    def table(self):
+        """All-pairs hop table, or None if the sculpture is too big for one. Built on first use
+           by running the breadth-first search from every edge at the same time.
+           """
+        if self._table is None and self.numEdges <= self.maxAllPairs:
+            n = self.numEdges
+            table = numpy.empty((n, n), dtype=numpy.uint16)
+            table.fill(UNREACHABLE)
+            sources = edges = numpy.arange(n)
+            table[sources, edges] = 0
+            level = 0
+            while len(edges):
+                level += 1
+                sources, edges = self._expand(sources, edges)
+                new = table[sources, edges] == UNREACHABLE
+                pairs = numpy.unique(sources[new] * n + edges[new])
+                sources, edges = pairs // n, pairs % n
+                table[sources, edges] = level
+
+            if level < 0xFF:
+                # Everything fits in a byte, with 0xFF taking over as the unreachable marker
+                narrow = table.astype(numpy.uint8)
+                narrow[table == UNREACHABLE] = 0xFF
+                table = narrow
+            self._table = table
+        return self._table
+
+    def distancesFrom(self, sources):
+        """Hop count from the nearest of 'sources' to every edge. Unreachable edges get the
+           largest value of the returned dtype. The result may be shared, so don't modify it.
+           """
+        sources = tuple(sorted(set(numpy.asarray(sources, dtype=int).reshape(-1).tolist())))
+        table = self.table
+        if table is not None:
+            return table[list(sources)].min(axis=0)
+
+        row = self._rows.get(sources)
+        if row is None:
+            row = self.hopsFrom(sources)
+            row.setflags(write=False)
+            if len(self._rows) >= self.cacheSize + len(self.landmarks):
+                # Forget something we computed on demand, but keep the landmarks
+                for key in list(self._rows):
+                    if len(key) != 1 or key[0] not in self.landmarks:
+                        del self._rows[key]
+                        break
+            self._rows[sources] = row
+        return row
+
+    def landmarkTable(self):
+        """One uint16 row of hop counts for each landmark edge, in the order given. Rows are
+           computed the first time they're needed and kept, and distancesFrom() a single
+           landmark uses them.
+           """
+        rows = []
+        for landmark in self.landmarks:
+            row = self._rows.get((landmark,))
+            if row is None:
+                row = self.hopsFrom(landmark)
+                row.setflags(write=False)
+                self._rows[(landmark,)] = row
+            rows.append(row)
+        return numpy.array(rows, dtype=numpy.uint16).reshape(-1, self.numEdges)
+
+    def between(self, a, b):
+        """Hop count between two edges"""
+        table = self.table
+        if table is not None:
+            return int(table[a, b])
+        return int(self.distancesFrom(a)[b])
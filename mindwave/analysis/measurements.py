@@ -0,0 +1,233 @@
+#!/usr/bin/python
+
+'''Loads every session in measurements/ into one columnar dataset
+
+The recordings come in two layouts: the early datapoints_*.csv files
+(time, ..., poorsignal, no blink) and the record_to_csv.py files under
+sarah-*/ (timestamp, poor_signal, ..., blink). Both are parsed in parallel,
+normalized to the same column names and dtypes, and concatenated. The result
+is cached as one .npy file per column, which later runs memory-map instead of
+parsing anything. The cache is rebuilt whenever a CSV is added, removed or
+modified.
+
+Usage: python measurements.py [column] [window]
+
+Prints rolling-window statistics of a column (default attention) for each
+condition, with clean datapoints only, like the R scripts.
+'''
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy
+
+MEASUREMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'measurements')
+CACHE_DIRNAME = '.column-cache'
+CACHE_VERSION = 1
+
+# Same as mindwave.WAVE_NAMES_IN_ORDER, copied so analysis doesn't need the bluetooth library
+WAVE_NAMES_IN_ORDER = [
+  'delta', 'theta', 'alpha_low', 'alpha_high',
+  'beta_low', 'beta_high', 'gamma_low', 'gamma_mid']
+
+# Older recordings use different column names for the same values
+COLUMN_ALIASES = {
+  'time': 'timestamp',
+  'poorsignal': 'poor_signal',
+}
+
+# Normalized columns and their dtypes. Missing values (blink, in the older files) are 0.
+COLUMNS = ([('timestamp', 'f8'),
+            ('poor_signal', 'i2'),
+            ('attention', 'i2'),
+            ('meditation', 'i2'),
+            ('blink', 'i2')] +
+           [(wave, 'i4') for wave in WAVE_NAMES_IN_ORDER])
+
+# Added to the merged dataset: which session each row came from, and seconds since
+# that session started
+DERIVED_COLUMNS = [('session', 'i2'), ('time_elapsed', 'f8')]
+
+
+def findSessions(directory=MEASUREMENTS_DIR):
+  '''Relative paths of every CSV under the measurements directory, sorted'''
+  found = []
+  for root, dirs, files in os.walk(directory):
+    dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+    for name in files:
+      if name.endswith('.csv'):
+        found.append(os.path.relpath(os.path.join(root, name), directory))
+  return sorted(found)
+
+
+def describeSession(path):
+  '''Condition and setup of a session, from its file name. Sarah's files are named
+  [wet|dry]-[condition][-k].csv; the others datapoints_[condition].csv.'''
+  name = os.path.splitext(os.path.basename(path))[0]
+  info = {'name': os.path.splitext(path)[0], 'gel': None, 'k': False}
+  if name.startswith('datapoints_'):
+    info['condition'] = name[len('datapoints_'):]
+  else:
+    info['gel'] = name[:3]
+    info['k'] = name.endswith('-k')
+    info['condition'] = name[4:-2] if info['k'] else name[4:]
+  return info
+
+
+def loadFile(filename):
+  '''Parses one CSV into a dict of normalized column arrays'''
+  with open(filename) as f:
+    header = [COLUMN_ALIASES.get(c, c) for c in f.readline().strip().split(',')]
+    table = numpy.loadtxt(f, delimiter=',', ndmin=2)
+  columns = {}
+  for name, dtype in COLUMNS:
+    if name in header:
+      columns[name] = table[:, header.index(name)].astype(dtype)
+    else:
+      columns[name] = numpy.zeros(len(table), dtype)
+  return columns
+
+
+def fingerprint(directory, sessions):
+  '''Identifies the exact set of CSVs the cache was built from'''
+  files = []
+  for path in sessions:
+    st = os.stat(os.path.join(directory, path))
+    files.append([path, st.st_size, int(st.st_mtime)])
+  return {'version': CACHE_VERSION, 'files': files}
+
+
+class Dataset:
+  """
+  All sessions, as parallel column arrays. Rows are in session order and time order
+  within each session. 'sessions' describes each session; the 'session' column
+  indexes into it.
+  """
+
+  def __init__(self, columns, sessions):
+    self.columns = columns
+    self.sessions = sessions
+    session = columns['session']
+    self.sessionStarts = numpy.searchsorted(session, numpy.arange(len(sessions) + 1))
+
+  def __getitem__(self, name):
+    return self.columns[name]
+
+  def __len__(self):
+    return len(self.columns['timestamp'])
+
+  def clean(self):
+    '''Mask of datapoints taken with the headset on properly'''
+    return ((self['poor_signal'] == 0) &
+            ((self['attention'] > 0) | (self['meditation'] > 0)))
+
+  def conditions(self):
+    '''Mask for each condition name, in sorted order'''
+    names = numpy.array([s['condition'] for s in self.sessions])
+    rowCondition = names[self['session']]
+    return [(c, rowCondition == c) for c in sorted(set(names))]
+
+  def rolling(self, name, window, mask=None):
+    '''Rolling mean and standard deviation of a column over the last 'window' rows of
+    the same session, computed with running sums so there's no Python loop. Rows
+    excluded by 'mask' are skipped: they don't count toward any window, and their
+    results are NaN.'''
+    values = numpy.asarray(self[name], dtype=float)
+    session = self['session']
+    if mask is not None:
+      values, session = values[mask], session[mask]
+    n = len(values)
+    index = numpy.arange(n)
+    starts = numpy.maximum(numpy.searchsorted(session, session), index - window + 1)
+    sums = numpy.concatenate(([0], numpy.cumsum(values)))
+    squares = numpy.concatenate(([0], numpy.cumsum(values * values)))
+    counts = index + 1 - starts
+    mean = (sums[index + 1] - sums[starts]) / counts
+    variance = (squares[index + 1] - squares[starts]) / counts - mean * mean
+    std = numpy.sqrt(numpy.maximum(variance, 0))
+    if mask is None:
+      return mean, std
+    fullMean = numpy.empty(len(self))
+    fullMean.fill(numpy.nan)
+    fullStd = fullMean.copy()
+    fullMean[mask] = mean
+    fullStd[mask] = std
+    return fullMean, fullStd
+
+  def conditionStats(self, name, window=10, cleanOnly=True):
+    '''For each condition: (condition, rows, mean, std, mean of the rolling std, min and
+    max of the rolling mean)'''
+    mask = self.clean() if cleanOnly else numpy.ones(len(self), dtype=bool)
+    mean, std = self.rolling(name, window, mask)
+    values = self[name]
+    stats = []
+    for condition, rows in self.conditions():
+      rows = rows & mask
+      if not rows.any():
+        continue
+      v = values[rows]
+      stats.append((condition, int(rows.sum()), v.mean(), v.std(), std[rows].mean(),
+                    mean[rows].min(), mean[rows].max()))
+    return stats
+
+
+def buildCache(directory, sessions, cacheDir, processes=None):
+  pool = multiprocessing.Pool(processes)
+  try:
+    tables = pool.map(loadFile, [os.path.join(directory, s) for s in sessions])
+  finally:
+    pool.close()
+    pool.join()
+
+  if not os.path.isdir(cacheDir):
+    os.makedirs(cacheDir)
+  for name, dtype in COLUMNS:
+    column = numpy.concatenate([t[name] for t in tables]) if tables else numpy.zeros(0, dtype)
+    numpy.save(os.path.join(cacheDir, name + '.npy'), column)
+  sessionIndex = numpy.concatenate(
+      [numpy.zeros(len(t['timestamp']), 'i2') + i for i, t in enumerate(tables)] or [numpy.zeros(0, 'i2')])
+  elapsed = numpy.concatenate(
+      [t['timestamp'] - t['timestamp'].min() for t in tables if len(t['timestamp'])] or [numpy.zeros(0)])
+  numpy.save(os.path.join(cacheDir, 'session.npy'), sessionIndex)
+  numpy.save(os.path.join(cacheDir, 'time_elapsed.npy'), elapsed)
+
+
+def load(directory=MEASUREMENTS_DIR, processes=None, rebuild=False):
+  '''Returns a Dataset of every session, from the column cache if it's current'''
+  sessions = findSessions(directory)
+  cacheDir = os.path.join(directory, CACHE_DIRNAME)
+  manifestFile = os.path.join(cacheDir, 'manifest.json')
+  current = fingerprint(directory, sessions)
+
+  try:
+    manifest = json.load(open(manifestFile))
+  except (IOError, ValueError):
+    manifest = None
+  if rebuild or manifest != current:
+    buildCache(directory, sessions, cacheDir, processes)
+    with open(manifestFile, 'w') as f:
+      f.write(json.dumps(current, sort_keys=True, indent=4, separators=(',', ': ')))
+
+  columns = dict((name, numpy.load(os.path.join(cacheDir, name + '.npy'), mmap_mode='r'))
+                 for name, dtype in COLUMNS + DERIVED_COLUMNS)
+  return Dataset(columns, [describeSession(s) for s in sessions])
+
+
+if __name__ == '__main__':
+  column = sys.argv[1] if len(sys.argv) > 1 else 'attention'
+  window = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+  start = time.time()
+  data = load()
+  stats = data.conditionStats(column, window)
+  elapsed = time.time() - start
+
+  print "%-28s %6s %8s %8s %10s %8s %8s" % (
+      'condition', 'rows', 'mean', 'std', 'roll std', 'roll min', 'roll max')
+  for row in stats:
+    print "%-28s %6d %8.2f %8.2f %10.2f %8.2f %8.2f" % row
+  print "%d datapoints from %d sessions, loaded and analyzed in %.3f s" % (
+      len(data), len(data.sessions), elapsed)
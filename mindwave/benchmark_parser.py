@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+'''Compares the old byte-at-a-time packet reader with ThinkGearParser.
+
+Both readers pull from a fake socket serving a recorded byte stream (pass a
+file name), or a synthetic one shaped like the headset's: 512 raw voltage
+packets for every full packet of eSense and EEG wave values, with the odd
+corrupted packet thrown in.
+'''
+
+import random
+import sys
+import time
+
+from mindwave import (ThinkGearParser, encodePacket, encodeRow, computeChecksum,
+                      POOR_SIGNAL, ATTENTION, MEDITATION, EEG_WAVES, RAW, SYNC)
+
+
+class StreamSocket:
+  '''Serves a byte string through recv(), like a socket'''
+
+  def __init__(self, data):
+    self.data = data
+    self.pos = 0
+
+  def recv(self, numbytes):
+    chunk = self.data[self.pos:self.pos + numbytes]
+    self.pos += len(chunk)
+    return chunk
+
+
+def synthesizeStream(seconds, seed=0):
+  rng = random.Random(seed)
+  packets = []
+  for second in range(seconds):
+    for i in range(512):
+      raw = rng.randint(0, 0xFFFF)
+      packets.append(encodePacket(encodeRow(RAW, [raw >> 8, raw & 0xFF])))
+    waves = [rng.randint(0, 255) for i in range(24)]
+    payload = (encodeRow(POOR_SIGNAL, [0]) + encodeRow(ATTENTION, [rng.randint(1, 100)]) +
+               encodeRow(MEDITATION, [rng.randint(1, 100)]) + encodeRow(EEG_WAVES, waves))
+    packet = encodePacket(payload)
+    if second % 10 == 9:
+      packet[-1] ^= 0xFF  # Bad checksum
+    packets.append(packet)
+  return str(bytearray().join(packets))
+
+
+def legacyPackets(sock):
+  '''The reader BluetoothHeadset used before ThinkGearParser'''
+  def readBytes(numbytes):
+    received = ""
+    while numbytes > 0:
+      chunk = sock.recv(numbytes)
+      if not chunk:
+        raise EOFError()
+      received += chunk
+      numbytes -= len(chunk)
+    return [ord(b) for b in received]
+
+  count = 0
+  try:
+    while True:
+      while not (readBytes(1)[0] == SYNC and readBytes(1)[0] == SYNC):
+        pass
+      plen = readBytes(1)[0]
+      if plen > 169:
+        continue
+      payload = readBytes(plen)
+      checksum = readBytes(1)[0]
+      if checksum == computeChecksum(payload):
+        count += 1
+  except EOFError:
+    return count
+
+
+def parserPackets(sock, chunkSize=1024):
+  parser = ThinkGearParser(chunkSize)
+  count = 0
+  while True:
+    try:
+      parser.fill(sock)
+    except IOError:
+      return count
+    for payload in parser.packets():
+      count += 1
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    data = open(sys.argv[1], 'rb').read()
+  else:
+    data = synthesizeStream(60)
+  print "%d bytes" % len(data)
+  for name, reader in (('legacy', legacyPackets), ('ThinkGearParser', parserPackets)):
+    start = time.time()
+    count = reader(StreamSocket(data))
+    elapsed = time.time() - start
+    print "%-16s %7d packets in %.3f s (%.0f packets/s)" % (
+        name, count, elapsed, count / elapsed)
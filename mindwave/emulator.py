@@ -0,0 +1,190 @@
+#!/usr/bin/python
+
+'''Plays recorded sessions back as a ThinkGear byte stream over TCP
+
+Reads recorded sessions (datapoint CSVs like the ones in measurements/, or
+binary session logs) and encodes every datapoint as the headset would send it:
+512 packets of raw voltage followed by one packet with poor signal, attention,
+meditation, blink and the EEG band powers. Raw voltages come from the log if it
+has them, otherwise they're synthesized from the band powers, one sine per band.
+
+Point a TCPHeadset at it to run the real parser without Bluetooth:
+
+  python emulator.py measurements/datapoints_working.csv --rate 10 --corruption 0.001
+
+  from mindwave import TCPHeadset
+  h = TCPHeadset('localhost', 13854)
+  print h.readDatapoint(wait_for_clean_data=True)
+'''
+
+import argparse
+import logging
+import math
+import random
+import socket
+import threading
+import time
+
+from mindwave import (encodePacket, encodeRow, loadSession, WAVE_NAMES_IN_ORDER,
+                      POOR_SIGNAL, ATTENTION, MEDITATION, BLINK, EEG_WAVES, RAW)
+
+RAW_RATE = 512  # Raw samples per second
+
+# A frequency (Hz) inside each of the headset's EEG bands, used to synthesize raw voltages
+BAND_FREQUENCIES = {
+  'delta': 2, 'theta': 5, 'alpha_low': 8, 'alpha_high': 11,
+  'beta_low': 15, 'beta_high': 24, 'gamma_low': 35, 'gamma_mid': 45}
+
+# Peak raw amplitude of the synthesized signal, plus noise
+RAW_AMPLITUDE = 1500
+RAW_NOISE = 20
+
+
+def field(point, name, default=0):
+  value = getattr(point, name, None)
+  return default if value is None else value
+
+
+class ThinkGearEmulator:
+  """
+  Encodes Datapoints into ThinkGear packets and streams them to TCP clients, one
+  client at a time.
+
+  rate scales playback speed: 1.0 sends one datapoint per second like the headset, 10
+  sends ten, and 0 sends as fast as the client reads. corruption is the chance that
+  each packet has one byte replaced with garbage, to exercise resyncing.
+  """
+
+  def __init__(self, rows, rate=1.0, corruption=0.0, loop=True, seed=None,
+               packetsPerWrite=16):
+    self.rows = rows
+    self.rate = rate
+    self.corruption = corruption
+    self.loop = loop
+    self.rng = random.Random(seed)
+    self.packetsPerWrite = packetsPerWrite
+    self.running = False
+    # One second of each band's sine, in raw samples
+    self.sines = dict(
+        (wave, [math.sin(2 * math.pi * freq * n / RAW_RATE) for n in range(RAW_RATE)])
+        for wave, freq in BAND_FREQUENCIES.items())
+
+  def rawVoltages(self, row):
+    '''The row's recorded raw samples, or one second of synthetic ones whose spectrum
+    follows its band powers'''
+    if row.raw_voltages:
+      return row.raw_voltages
+    amplitudes = [(self.sines[wave], math.sqrt(field(row, wave))) for wave in WAVE_NAMES_IN_ORDER]
+    total = sum(a for s, a in amplitudes)
+    scale = RAW_AMPLITUDE / total if total else 0
+    gauss = self.rng.gauss
+    return [int(scale * sum(s[n] * a for s, a in amplitudes) + gauss(0, RAW_NOISE))
+            for n in range(RAW_RATE)]
+
+  def encodeRow(self, row):
+    '''The packets the headset would send over one second for one Datapoint'''
+    packets = []
+    for raw in self.rawVoltages(row):
+      raw &= 0xFFFF
+      packets.append(encodePacket(encodeRow(RAW, [raw >> 8, raw & 0xFF])))
+    waves = bytearray()
+    for wave in WAVE_NAMES_IN_ORDER:
+      value = min(max(field(row, wave), 0), 0xFFFFFF)
+      waves += bytearray([value & 0xFF, (value >> 8) & 0xFF, value >> 16])
+    payload = (encodeRow(POOR_SIGNAL, [min(field(row, 'poor_signal', 200), 255)]) +
+               encodeRow(ATTENTION, [min(field(row, 'attention'), 255)]) +
+               encodeRow(MEDITATION, [min(field(row, 'meditation'), 255)]) +
+               encodeRow(EEG_WAVES, waves))
+    if field(row, 'blink'):
+      payload += encodeRow(BLINK, [min(row.blink, 255)])
+    packets.append(encodePacket(payload))
+    return packets
+
+  def corrupt(self, packet):
+    if self.corruption and self.rng.random() < self.corruption:
+      packet[self.rng.randrange(len(packet))] = self.rng.randrange(256)
+    return packet
+
+  def stream(self):
+    '''Yields (seconds of session time, bytes) in small batches, forever if looping'''
+    elapsed = 0.0
+    while True:
+      for row in self.rows:
+        packets = self.encodeRow(row)
+        for i in range(0, len(packets), self.packetsPerWrite):
+          batch = packets[i:i + self.packetsPerWrite]
+          elapsed += len(batch) / float(len(packets))
+          yield elapsed, str(bytearray().join(self.corrupt(p) for p in batch))
+      if not self.loop:
+        return
+
+  def sendTo(self, connection):
+    '''Streams the session to one connection until it closes or the session ends'''
+    start = time.time()
+    for elapsed, data in self.stream():
+      if not self.running:
+        return
+      if self.rate:
+        delay = start + elapsed / self.rate - time.time()
+        if delay > 0:
+          time.sleep(delay)
+      connection.sendall(data)
+
+  def serve(self, host='localhost', port=13854):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1)
+    listener.settimeout(0.5)
+    self.running = True
+    logging.info("Emulating a headset at %s:%d" % (host, port))
+    try:
+      while self.running:
+        try:
+          connection, address = listener.accept()
+        except socket.timeout:
+          continue
+        logging.info("Client connected from %s:%d" % address)
+        try:
+          self.sendTo(connection)
+        except socket.error, e:
+          logging.info("Client went away: %s" % str(e))
+        finally:
+          connection.close()
+    finally:
+      listener.close()
+
+  def start(self, host='localhost', port=13854):
+    '''Serves from a background thread'''
+    thread = threading.Thread(target=self.serve, args=(host, port))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+  def stop(self):
+    self.running = False
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Serve recorded Mindwave sessions as a ThinkGear stream')
+  parser.add_argument('sessions', nargs='+', help='datapoint CSVs or session logs, played back in order')
+  parser.add_argument('--host', default='localhost')
+  parser.add_argument('--port', type=int, default=13854)
+  parser.add_argument('--rate', type=float, default=1.0,
+                      help='playback speed multiplier, 0 for as fast as possible')
+  parser.add_argument('--corruption', type=float, default=0.0,
+                      help='probability of corrupting each packet')
+  parser.add_argument('--once', action='store_true', help="don't loop the session")
+  parser.add_argument('--seed', type=int)
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO)
+  rows = []
+  for filename in args.sessions:
+    rows.extend(loadSession(filename))
+  emulator = ThinkGearEmulator(rows, rate=args.rate, corruption=args.corruption,
+                               loop=not args.once, seed=args.seed)
+  try:
+    emulator.serve(args.host, args.port)
+  except KeyboardInterrupt:
+    pass
@@ -22,9 +22,12 @@ Details of the communications protocol can be found here:
   http://wearcam.org/ece516/mindset_communications_protocol.pdf
 '''
 
+import bisect
 import bluetooth
+import csv
 import datetime
 import logging
+import socket
 import time
 import random
 
@@ -34,6 +37,7 @@ logging.basicConfig(level=LOGGING_LEVEL, format='%(message)s')
 
 # Byte codes from Neurosky
 SYNC                 = 0xAA
+SYNC_PAIR            = b'\xAA\xAA'
 POOR_SIGNAL          = 0x02
 ATTENTION            = 0x04
 MEDITATION           = 0x05
@@ -87,8 +91,7 @@ class Datapoint():
       self.blink = values[0]
     elif code == EEG_WAVES:
       for i, wave in enumerate(WAVE_NAMES_IN_ORDER):
-        setattr(self, wave, self.computeWaveValue(values[:3]))
-        values = values[3:]
+        setattr(self, wave, self.computeWaveValue(values[3*i:3*i + 3]))
     elif code == RAW:
       raw = (values[0] << 8) + values[1]
       # This should be interpreted as a signed value, so if
@@ -128,6 +131,169 @@ class Datapoint():
     lines.append("*" * 40)
     return "\n".join(lines)
 
+# Datapoint fields saved in recordings. Older recordings use different column names
+# for some of them.
+RECORDED_FIELDS = (['poor_signal', 'attention', 'meditation', 'blink'] +
+                   WAVE_NAMES_IN_ORDER)
+COLUMN_ALIASES = {
+  'time': 'timestamp',
+  'poorsignal': 'poor_signal',
+}
+
+
+def loadSession(filename):
+  '''Reads a recorded session into a list of Datapoints, keeping their original
+  timestamps. Takes a datapoint CSV (either column layout in measurements/) or a
+  binary log from session_log.py. Only binary logs have raw voltages.'''
+  points = []
+  if filename.endswith('.csv'):
+    with open(filename) as f:
+      for record in csv.DictReader(f):
+        point = Datapoint()
+        for key, value in record.items():
+          key = COLUMN_ALIASES.get(key, key)
+          if key == 'timestamp':
+            point.timestamp = float(value)
+          elif key in RECORDED_FIELDS:
+            setattr(point, key, int(float(value)))
+        points.append(point)
+  else:
+    import session_log  # Needs numpy, so only when it's used
+    records, raw, rawTimes = session_log.readSession(filename)
+    for record in records.tolist():
+      record = dict(zip(records.dtype.names, record))
+      point = Datapoint()
+      point.timestamp = record['timestamp']
+      for field in RECORDED_FIELDS:
+        value = record[field]
+        setattr(point, field, None if value < 0 else value)
+      start = record['raw_start']
+      point.raw_voltages = raw[start:start + record['raw_count']].tolist()
+      points.append(point)
+  return points
+
+
+MAX_PAYLOAD_LENGTH = 169  # Theoretical maximum size, according to datasheet
+
+
+def computeChecksum(data):
+  s = sum(data)  # Sum up bytes
+  s &= 0xFF  # Take the last 8 bits (e.g. mod by 256)
+  return 0xFF - s  # Invert bits
+
+def encodeRow(code, values=()):
+  '''Encodes one data row. Codes above 0x7F are multi-byte and get a length byte.'''
+  values = bytearray(values)
+  if code > 0x7F:
+    return bytearray([code, len(values)]) + values
+  return bytearray([code]) + values
+
+def encodePacket(payload):
+  '''Wraps a payload (e.g. some encoded rows) in sync bytes, length and checksum.'''
+  payload = bytearray(payload)
+  return bytearray([SYNC, SYNC, len(payload)]) + payload + bytearray([computeChecksum(payload)])
+
+
+class ThinkGearParser:
+  """
+  Incremental parser for the ThinkGear byte stream.
+
+  Bytes are appended to a buffer in large chunks, with feed() or fill(). Complete
+  packets are found in place: bytearray.find() jumps straight to each SYNC pair, the
+  checksum is computed over the payload, and a read position moves past everything
+  consumed. The consumed front of the buffer is dropped only now and then, so we never
+  rebuild strings or lists byte by byte.
+  """
+
+  def __init__(self, chunkSize=1024):
+    self.chunkSize = chunkSize
+    self.buffer = bytearray()
+    self.pos = 0
+    self.packetCount = 0
+    self.badLengthCount = 0
+    self.badChecksumCount = 0
+
+  def feed(self, data):
+    if self.pos > 4096 and self.pos * 2 > len(self.buffer):
+      del self.buffer[:self.pos]
+      self.pos = 0
+    self.buffer.extend(data)
+
+  def fill(self, sock):
+    '''Reads one chunk from the socket into the buffer. Raises IOError on a closed connection.'''
+    data = sock.recv(self.chunkSize)
+    if not data:
+      raise IOError("Headset connection closed")
+    self.feed(data)
+
+  def nextPacket(self):
+    '''Returns the payload of the next valid packet in the buffer, or None if there
+    isn't a complete one yet. Bad packets are logged and skipped.'''
+    buf = self.buffer
+    end = len(buf)
+    while True:
+      i = buf.find(SYNC_PAIR, self.pos)
+      if i < 0:
+        # Keep a trailing SYNC, it may be the first half of a pair
+        self.pos = max(self.pos, end - 1)
+        return None
+      if i + 3 > end:
+        self.pos = i
+        return None
+      plen = buf[i + 2]
+      if plen == SYNC:
+        # Extra sync byte, the packet starts one byte later
+        self.pos = i + 1
+        continue
+      if plen > MAX_PAYLOAD_LENGTH:
+        logging.error("Bad packet length. Max is %d, received %d." % (MAX_PAYLOAD_LENGTH, plen))
+        self.badLengthCount += 1
+        self.pos = i + 2
+        continue
+      start = i + 3
+      stop = start + plen
+      if stop + 1 > end:
+        self.pos = i
+        return None
+      payload = buf[start:stop]
+      checksum = buf[stop]
+      computed_checksum = computeChecksum(payload)
+      if checksum != computed_checksum:
+        logging.error("Bad checksum. Expected %d, computed %d." % (
+            checksum, computed_checksum))
+        self.badChecksumCount += 1
+        self.pos = i + 2
+        continue
+      self.pos = stop + 1
+      self.packetCount += 1
+      return payload
+
+  def packets(self):
+    '''Yields the payload of every complete packet currently in the buffer'''
+    payload = self.nextPacket()
+    while payload is not None:
+      yield payload
+      payload = self.nextPacket()
+
+  @staticmethod
+  def rows(payload):
+    '''Yields (code, values) for each data row in a payload, walking it by offset'''
+    i = 0
+    end = len(payload)
+    while i < end:
+      code = payload[i]
+      if code <= 0x7F:  # Single-byte value
+        num_value_bytes = 1
+        i += 1
+      else:
+        if i + 1 >= end:
+          return
+        num_value_bytes = payload[i + 1]
+        i += 2
+      yield code, payload[i:i + num_value_bytes]
+      i += num_value_bytes
+
+
 class Headset:
   """
   Abstract base class for connecting and reading datapoints
@@ -216,24 +382,37 @@ class BluetoothHeadset(Headset):
   def __init__(self, macaddr='74:E5:43:B1:93:D5'):
     self.macaddr = macaddr
     self.socket = None
+    self.parser = ThinkGearParser()
+    # Datapoint being assembled by readAvailable()
+    self.partial = Datapoint()
+    # Called with each raw voltage as soon as it arrives, if set
+    self.rawListener = None
 
   def connect(self):
+    while not self.tryConnect():
+      time.sleep(5)
+
+  def tryConnect(self):
+    '''Makes one attempt to connect, returning whether it succeeded'''
     logging.info("Attempting to connect to headset at %s" % self.macaddr)
-    while True:
-      try:
-        logging.info("Connecting...")
-        self.socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-        self.socket.connect((self.macaddr, 1))
-        logging.info("...connected!")
-        return
-      except bluetooth.BluetoothError, e:
-        logging.error("...failed to connect to headset(will retry in 5s). "
-                      "Error: %s" % str(e))
-        time.sleep(5)
+    try:
+      logging.info("Connecting...")
+      self.socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+      self.socket.connect((self.macaddr, 1))
+      logging.info("...connected!")
+      return True
+    except bluetooth.BluetoothError, e:
+      logging.error("...failed to connect to headset(will retry in 5s). "
+                    "Error: %s" % str(e))
+      self.socket = None
+      return False
 
   def disconnect(self):
     logging.info("Disconnecting...")
     self.socket.close()
+    self.socket = None
+    self.parser = ThinkGearParser()
+    self.partial = Datapoint()
     logging.info("...disconnected from headset.")
 
   def readDatapoint(self, wait_for_clean_data=False):
@@ -248,17 +427,13 @@ class BluetoothHeadset(Headset):
           # some of the measurements. We need to keep reading packets until we
           # have all the measurements of one complete Datapoint.
           payload = self.readOnePacket()
-          if payload is None:
-            # Error reading packet
-            logging.error("Dropping packet")
-            continue
-          logging.debug("Read payload of size %d" % len(payload))
           # Each packet's payload is a series of "data rows" that must be parsed.
           # A "data row" has one of the many possible measurements. A packet may
           # only contain rows for a subset of the measurements.
-          while payload:
-            payload, code, values = self.pullOneDataRow(payload)
+          for code, values in self.parser.rows(payload):
             datapoint.updateValues(code, values)
+            if code == RAW and self.rawListener:
+              self.rawListener(datapoint.raw_voltages[-1])
         if wait_for_clean_data and not datapoint.headsetOn():
           logging.info(
               "Datapoint not clean (either headset is not on properly, or "
@@ -268,68 +443,150 @@ class BluetoothHeadset(Headset):
           break
       logging.debug(datapoint)
       return datapoint
-    except bluetooth.BluetoothError, e:
+    except (bluetooth.BluetoothError, IOError), e:
       logging.error("Bluetooth error interacting with headset: %s" % str(e))
       return None
 
+  def readAvailable(self):
+    '''Reads one chunk from the socket and returns the Datapoints it completed, if any.
+    For callers that wait for the socket to be readable themselves, e.g. with select().
+    Raises IOError (or BluetoothError) if the connection is lost.'''
+    self.parser.fill(self.socket)
+    completed = []
+    for payload in self.parser.packets():
+      for code, values in self.parser.rows(payload):
+        self.partial.updateValues(code, values)
+        if code == RAW and self.rawListener:
+          self.rawListener(self.partial.raw_voltages[-1])
+      if self.partial.complete():
+        completed.append(self.partial)
+        self.partial = Datapoint()
+    return completed
+
   def readOnePacket(self):
-    while not (self.readByte() == SYNC and self.readByte() == SYNC):
-      logging.debug("Reading bytes until we get to the start of a packet...")
-    logging.debug("Found double-sync byte, starting a new packet read.")
-    plen = self.readByte()
-    if plen > 169:  # Theoretical maximum size, according to datasheet
-      logging.error("Bad packet length. Max is 169, received %d." % plen)
-      return None
-    payload = self.readBytes(plen)
-    checksum = self.readByte()
-    computed_checksum = self.computeChecksum(payload)
-    if checksum != computed_checksum:
-      logging.error("Bad checksum. Expected %d, computed %d." % (
-          checksum, computed_checksum))
-      return None
-    logging.debug("Checksum OK (%d)" % checksum)
+    '''Returns the payload of the next valid packet, reading from the socket in
+    chunks until one is complete.'''
+    payload = self.parser.nextPacket()
+    while payload is None:
+      self.parser.fill(self.socket)
+      payload = self.parser.nextPacket()
+    logging.debug("Checksum OK, payload of size %d" % len(payload))
     return payload
 
-  def computeChecksum(self, data):
-    s = sum(data)  # Sum up bytes
-    s &= 0xFF  # Take the last 8 bits (e.g. mod by 256)
-    return 0xFF - s  # Invert bits
 
-  def pullOneDataRow(self, payload):
-    code = payload[0]
-    if code <= 0x7F:  # Single-byte value
-      num_value_bytes = 1
-      payload = payload[1:]
-    else:
-      num_value_bytes = payload[1]
-      payload = payload[2:]
-    values = payload[:num_value_bytes]
-    payload = payload[num_value_bytes:]
-    return payload, code, values
-
-  # Actual socket-using methods below
-
-  def readByte(self):
-    '''Reads a single byte as an integer 0-255'''
-    return self.readBytes(1)[0]
-
-  def readBytes(self, numbytes):
-    '''Reads the requested number of bytes from the headset.
-
-    Returns an array of integers, each in the 0-255 range
-    '''
-    # Sometimes the socket will not send all the requested bytes
-    # on the first request, therefore a loop is necessary...
-    missingBytes = numbytes
-    received = ""
-    while(numbytes > 0):
-        received += self.socket.recv(numbytes)
-        numbytes = numbytes - len(received)
-    # Python represents all bytes as strings. A raw byte (a number 0-255)
-    # is represented as something between '\x00' and '\xFF', not unlike
-    # chars in C or C++. socket.recv returns a string that is the
-    # concatenation of all bytes. For example, if it received 0x22 then 0x33,
-    # it would return '\x22\x33'.
-    # The 'ord' builtin converts raw bytes to integers,
-    # e.g. '\x12' becomes 18 (or equivalently 0x12)
-    return [ord(b) for b in received];
+class TCPHeadset(BluetoothHeadset):
+  """
+  Reads the same ThinkGear byte stream as BluetoothHeadset, but from a TCP socket.
+  Point it at emulator.py to exercise the parser without a headset.
+  """
+
+  def __init__(self, host='localhost', port=13854):
+    BluetoothHeadset.__init__(self)
+    self.host = host
+    self.port = port
+
+  def tryConnect(self):
+    logging.info("Attempting to connect to headset at %s:%d" % (self.host, self.port))
+    try:
+      logging.info("Connecting...")
+      self.socket = socket.create_connection((self.host, self.port))
+      logging.info("...connected!")
+      return True
+    except socket.error, e:
+      logging.error("...failed to connect to headset(will retry in 5s). "
+                    "Error: %s" % str(e))
+      self.socket = None
+      return False
+
+
+class ReplayHeadset(Headset):
+  """
+  Plays back recorded sessions as if they were coming from a headset, for tuning
+  effects against real brain data.
+
+  Sessions (CSV or binary logs, see loadSession) are spliced end to end in the order
+  given, with a one second gap between them. Datapoints come out with their recorded
+  spacing divided by speed; a speed of 0 returns them as fast as they're asked for.
+  When the end is reached, playback either loops or readDatapoint returns None.
+
+  clock is anything with time() and sleep() like the time module, which is the default.
+  Given a simulated clock (led/clock.py) that the render loop also runs on, an offline
+  render can read each datapoint once nextDue() has passed and never wait at all.
+  """
+
+  def __init__(self, sessions, speed=1.0, loop=False, gap=1.0, clock=time):
+    if isinstance(sessions, basestring):
+      sessions = [sessions]
+    self.speed = speed
+    self.loop = loop
+    self.clock = clock
+    self.points = []
+    # Seconds from the start of the spliced recording to each datapoint
+    self.offsets = []
+    end = 0
+    for session in sessions:
+      points = loadSession(session)
+      if not points:
+        continue
+      first = points[0].timestamp
+      for point in points:
+        self.points.append(point)
+        self.offsets.append(end + point.timestamp - first)
+      end = self.offsets[-1] + gap
+    self.duration = end
+    self.index = 0
+    self.connected = False
+    self.startWall = None
+    self.startOffset = 0
+
+  def connect(self):
+    self.connected = True
+    logging.info("Replaying %d datapoints (%.0f s)" % (len(self.points), self.duration))
+
+  def disconnect(self):
+    self.connected = False
+    self.startWall = None
+
+  def seek(self, seconds):
+    '''Continues playback from this many seconds into the spliced recording'''
+    self.index = bisect.bisect_left(
+        self.offsets, seconds % self.duration if self.loop and self.duration else seconds)
+    self.startWall = None
+
+  def position(self):
+    '''Seconds into the recording of the next datapoint'''
+    if self.index < len(self.offsets):
+      return self.offsets[self.index]
+    return self.duration
+
+  def nextDue(self):
+    '''Clock time at which the next datapoint is due, or None at the end of the recording.
+    Always the current time if playing as fast as possible.'''
+    if self.index >= len(self.points):
+      if not (self.loop and self.points):
+        return None
+      # Start over, with the clock carrying on from where the recording ended
+      self.index = 0
+      self.startOffset -= self.duration
+    if not self.speed:
+      return self.clock.time()
+    if self.startWall is None:
+      self.startWall = self.clock.time()
+      self.startOffset = self.offsets[self.index]
+    return self.startWall + (self.offsets[self.index] - self.startOffset) / self.speed
+
+  def readDatapoint(self, wait_for_clean_data=False):
+    if not self.connected:
+      self.connect()
+    while True:
+      due = self.nextDue()
+      if due is None:
+        return None
+      point = self.points[self.index]
+      self.index += 1
+      delay = due - self.clock.time()
+      if delay > 0:
+        self.clock.sleep(delay)
+      if not wait_for_clean_data or point.headsetOn():
+        logging.debug(point)
+        return point
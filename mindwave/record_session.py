@@ -0,0 +1,30 @@
+#!/usr/bin/python
+
+'''Records readings from the headset to a binary session log
+
+Usage: python record_session.py [filename]
+
+Convert the result with session_log.py if you want CSVs.
+'''
+
+import sys
+import time
+
+from mindwave import BluetoothHeadset, FakeHeadset
+from session_log import SessionWriter
+
+filename = sys.argv[1] if len(sys.argv) > 1 else time.strftime("session-%Y%m%d-%H%M%S.mwlog")
+writer = SessionWriter(filename)
+
+#h = FakeHeadset()
+h = BluetoothHeadset()
+try:
+  while True:
+    point = h.readDatapoint()
+    if point:
+      print point
+      writer.write(point)
+except KeyboardInterrupt:
+  pass
+finally:
+  writer.close()
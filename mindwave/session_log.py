@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+'''Compact binary recordings of headset sessions
+
+A session log is a short header followed by chunks. Each chunk is either a
+batch of datapoints, stored as records of DATAPOINT_DTYPE, or a run of raw
+voltages, stored as int16 along with the index and timestamp of its first
+sample. Every raw sample's time is the timestamp of the datapoint it arrived
+with, plus its position in that datapoint at 512 Hz. Each datapoint also
+records where its samples start in the raw stream and how many there are.
+
+SessionWriter does the writing from a background thread, so recording costs
+the reader nothing but a queue put per datapoint. It flushes once enough data
+is buffered or enough time has passed, whichever comes first.
+
+Convert to and from the CSV layout written by record_to_csv.py:
+
+  python session_log.py tocsv session.mwlog datapoints.csv raw_voltages.txt
+  python session_log.py fromcsv datapoints.csv raw_voltages.txt session.mwlog
+'''
+
+import csv
+import logging
+import Queue
+import struct
+import sys
+import threading
+import time
+
+import numpy
+
+from mindwave import WAVE_NAMES_IN_ORDER
+
+MAGIC = 'MWLOG'
+VERSION = 1
+FILE_HEADER = struct.Struct('<5sBH')   # magic, version, raw sample rate
+CHUNK_HEADER = struct.Struct('<cIQd')  # kind, count, first raw sample index, timestamp
+DATAPOINTS = 'D'
+RAW = 'R'
+
+RAW_RATE = 512
+
+DATAPOINT_DTYPE = numpy.dtype(
+    [('timestamp', '<f8'),
+     ('poor_signal', '<i2'),
+     ('attention', '<i2'),
+     ('meditation', '<i2'),
+     ('blink', '<i2')] +
+    [(wave, '<i4') for wave in WAVE_NAMES_IN_ORDER] +
+    [('raw_start', '<u8'),
+     ('raw_count', '<u4')])
+
+# Columns of the CSV written by record_to_csv.py
+CSV_FIELDS = ('timestamp,poor_signal,attention,meditation,blink'.split(',') +
+              WAVE_NAMES_IN_ORDER)
+
+
+class SessionWriter:
+  """
+  Appends datapoints and their raw voltages to a session log from a background thread.
+
+  Data is written out when at least flushBytes are buffered, or flushSecs after the
+  last write, whichever comes first. close() writes whatever is left.
+  """
+
+  def __init__(self, filename, flushBytes=1 << 16, flushSecs=5.0):
+    self.file = open(filename, 'wb')
+    self.file.write(FILE_HEADER.pack(MAGIC, VERSION, RAW_RATE))
+    self.flushBytes = flushBytes
+    self.flushSecs = flushSecs
+    self.queue = Queue.Queue()
+    self.rawIndex = 0
+    self.datapoints = []
+    self.raw = []           # (first sample index, timestamp, samples) per datapoint
+    self.bufferedBytes = 0
+    self.lastFlush = time.time()
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def write(self, datapoint):
+    '''Queues a Datapoint for writing. Cheap enough to call from the reading loop.'''
+    self.queue.put(datapoint)
+
+  def close(self):
+    self.queue.put(None)
+    self.thread.join()
+    self.file.close()
+
+  def run(self):
+    while True:
+      timeout = max(0, self.lastFlush + self.flushSecs - time.time())
+      try:
+        datapoint = self.queue.get(timeout=timeout)
+      except Queue.Empty:
+        self.flush()
+        continue
+      if datapoint is None:
+        self.flush()
+        return
+      self.add(datapoint)
+      if self.bufferedBytes >= self.flushBytes:
+        self.flush()
+
+  def add(self, datapoint):
+    record = [datapoint.timestamp]
+    for field in CSV_FIELDS[1:]:
+      value = getattr(datapoint, field, None)
+      record.append(-1 if value is None else value)
+    count = len(datapoint.raw_voltages)
+    record += [self.rawIndex, count]
+    self.datapoints.append(tuple(record))
+    if count:
+      self.raw.append((self.rawIndex, datapoint.timestamp, datapoint.raw_voltages))
+      self.rawIndex += count
+    self.bufferedBytes += DATAPOINT_DTYPE.itemsize + 2 * count
+
+  def flush(self):
+    if self.datapoints:
+      records = numpy.array(self.datapoints, dtype=DATAPOINT_DTYPE)
+      self.file.write(CHUNK_HEADER.pack(DATAPOINTS, len(records), 0, 0))
+      self.file.write(records.tobytes())
+    for start, timestamp, samples in self.raw:
+      samples = numpy.array(samples, dtype='<i2')
+      self.file.write(CHUNK_HEADER.pack(RAW, len(samples), start, timestamp))
+      self.file.write(samples.tobytes())
+    self.file.flush()
+    self.datapoints = []
+    self.raw = []
+    self.bufferedBytes = 0
+    self.lastFlush = time.time()
+
+
+def readSession(filename):
+  '''Returns (datapoints, raw, rawTimes): a DATAPOINT_DTYPE array, the int16 raw voltages,
+  and the timestamp of each raw sample. A chunk cut short at the end of the file, say by
+  a crash mid-write, is dropped.'''
+  data = open(filename, 'rb').read()
+  magic, version, rawRate = FILE_HEADER.unpack_from(data)
+  if magic != MAGIC or version != VERSION:
+    raise ValueError("%s is not a version %d session log" % (filename, VERSION))
+
+  datapoints = []
+  raw = []
+  rawTimes = []
+  offset = FILE_HEADER.size
+  while offset + CHUNK_HEADER.size <= len(data):
+    kind, count, start, timestamp = CHUNK_HEADER.unpack_from(data, offset)
+    offset += CHUNK_HEADER.size
+    dtype = DATAPOINT_DTYPE if kind == DATAPOINTS else numpy.dtype('<i2')
+    size = count * dtype.itemsize
+    if offset + size > len(data):
+      logging.warning("Dropping truncated chunk at the end of %s" % filename)
+      break
+    chunk = numpy.frombuffer(data, dtype, count, offset)
+    offset += size
+    if kind == DATAPOINTS:
+      datapoints.append(chunk)
+    else:
+      raw.append(chunk)
+      rawTimes.append(timestamp + numpy.arange(count) / float(rawRate))
+
+  def join(chunks, dtype):
+    return numpy.concatenate(chunks) if chunks else numpy.zeros(0, dtype)
+  return (join(datapoints, DATAPOINT_DTYPE), join(raw, '<i2'), join(rawTimes, float))
+
+
+def toCSV(logFilename, measurementsFilename, rawFilename):
+  '''Writes a session log out as record_to_csv.py would have'''
+  datapoints, raw, rawTimes = readSession(logFilename)
+  with open(measurementsFilename, 'w') as f:
+    print >>f, ",".join(CSV_FIELDS)
+    for record in datapoints:
+      values = [repr(float(record['timestamp']))] + [str(record[field]) for field in CSV_FIELDS[1:]]
+      print >>f, ",".join(values)
+  with open(rawFilename, 'w') as f:
+    f.write("".join("%d\n" % v for v in raw.tolist()))
+
+
+def fromCSV(measurementsFilename, rawFilename, logFilename):
+  '''Builds a session log from record_to_csv.py output. The text files don't say which
+  raw samples arrived with which datapoint, so each datapoint is given the next 512
+  (the headset's rate), and any left over go to the last one.'''
+  with open(measurementsFilename) as f:
+    rows = list(csv.DictReader(f))
+  raw = numpy.loadtxt(rawFilename, dtype=int, ndmin=1) if rawFilename else numpy.zeros(0, int)
+
+  records = numpy.zeros(len(rows), dtype=DATAPOINT_DTYPE)
+  for i, row in enumerate(rows):
+    records[i]['timestamp'] = float(row['timestamp'])
+    for field in CSV_FIELDS[1:]:
+      records[i][field] = int(float(row.get(field) or -1))
+  starts = numpy.minimum(numpy.arange(len(rows)) * RAW_RATE, len(raw))
+  ends = numpy.append(starts[1:], len(raw))
+  records['raw_start'] = starts
+  records['raw_count'] = ends - starts
+
+  with open(logFilename, 'wb') as f:
+    f.write(FILE_HEADER.pack(MAGIC, VERSION, RAW_RATE))
+    f.write(CHUNK_HEADER.pack(DATAPOINTS, len(records), 0, 0))
+    f.write(records.tobytes())
+    for record, start, end in zip(records, starts, ends):
+      if end > start:
+        f.write(CHUNK_HEADER.pack(RAW, int(end - start), int(start), float(record['timestamp'])))
+        f.write(raw[start:end].astype('<i2').tobytes())
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 5 or sys.argv[1] not in ('tocsv', 'fromcsv'):
+    print __doc__
+    sys.exit(1)
+  if sys.argv[1] == 'tocsv':
+    toCSV(*sys.argv[2:])
+  else:
+    fromCSV(*sys.argv[2:])
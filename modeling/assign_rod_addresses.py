@@ -2,6 +2,7 @@
 import sys
 import json
 import math
+import edge_graph
 
 data = json.load(open(sys.argv[1]))
 
@@ -13,8 +14,6 @@ root_edges = [x for x in range(0,6)]
 edge_data = {int(key): data['edges'][key] for key in data['edges']}
 node_data = {int(key): data['nodes'][key] for key in data['nodes']}
 
-edge_parents = { x: None for x in root_edges }
-
 def polarify(cartesian):
   x,y,z = cartesian
   r = math.sqrt( x**2 + y**2 )
@@ -28,28 +27,29 @@ def round_order(edge):
 
 edge_addr = { x: str(i+1) for i, x in enumerate(sorted(root_edges, key=round_order)) }
 
-child_count = { x: 0 for x in edge_data }
-
 def edge_value(edge, d):
   if d == 2:
     # first branch is low, middle, high
     return node_data[edge_data[edge][1]][2] # Z-index
   return( (math.pi/2 - polarify( node_data[edge_data[edge][1]] )[1]) % (math.pi*2) )
 
-for depth in range(6):
-  sorted_edges = sorted(edge_data, key=(lambda e: edge_value(e,depth)))
-  unlinked_edges = [ x for x in sorted_edges if x not in edge_parents]
-  existing_parents = {k:edge_parents[k] for k in edge_parents}
-  for edge in unlinked_edges:
-    for possible_parent in sorted(existing_parents, key=round_order ):
-      for vertex in edge_data[edge]:
-        if vertex in edge_data[possible_parent]:
-          if not edge in edge_parents:
-            parent = possible_parent
-            edge_parents[edge] = parent
-            child_count[parent] += 1
-            edge_addr[edge] = edge_addr[parent] + "." + str(child_count[parent])
-  if not unlinked_edges:
-    break
+# ties keep the order edges come out of edge_data
+position = { x: i for i, x in enumerate(edge_data) }
+
+def child_order(depth, edges):
+  return sorted(edges, key=(lambda e: (edge_value(e,depth-1), position[e])))
+
+def first_parent(edge, candidates):
+  return min(candidates, key=round_order)
+
+edge_parents, levels = edge_graph.EdgeGraph(edge_data).levels(
+  root_edges, max_depth=6, order=child_order, choose=first_parent)
+
+child_count = { x: 0 for x in edge_data }
+for level in levels[1:]:
+  for edge in level:
+    parent = edge_parents[edge]
+    child_count[parent] += 1
+    edge_addr[edge] = edge_addr[parent] + "." + str(child_count[parent])
 
 print(json.dumps(edge_addr, sort_keys=True, indent=4, separators=(',', ': ')))
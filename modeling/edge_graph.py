@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# The sculpture as a graph of rods, for the scripts that walk it: which rods meet at
+# each node, which tree each node belongs to, and how rods branch from the roots up.
+#
+# Edges come straight from graph.*.data.json, {edge id: [lower node, upper node]}.
+# Which rods touch each node is worked out once up front, so walking the trees takes
+# time in proportion to the number of rods, not its square.
+
+
+class EdgeGraph(object):
+
+  def __init__(self, edges):
+    self.edges = edges
+    self.touching = {}    # node -> ids of the edges with an end at that node
+    self.ending = {}      # node -> ids of the edges whose upper node it is
+    for edge_id, (lower, upper) in edges.items():
+      self.touching.setdefault(lower, []).append(edge_id)
+      if upper != lower:
+        self.touching.setdefault(upper, []).append(edge_id)
+      self.ending.setdefault(upper, []).append(edge_id)
+
+  def neighbors(self, edge_id):
+    '''Edges sharing a node with this one'''
+    found = []
+    for node in self.edges[edge_id]:
+      for other in self.touching[node]:
+        if other != edge_id and other not in found:
+          found.append(other)
+    return found
+
+  def is_root(self, edge_id):
+    '''True if no other edge ends where this one starts'''
+    lower = self.edges[edge_id][0]
+    return all(other == edge_id for other in self.ending.get(lower, ()))
+
+  def parents(self, edge_id):
+    '''Edges whose upper node is this edge's lower node'''
+    return self.ending.get(self.edges[edge_id][0], [])
+
+  def levels(self, roots, max_depth=None, order=None, choose=None):
+    '''Breadth-first walk from the root edges. Level n is every edge not yet reached
+    that shares a node with an edge of level n - 1; the roots are level 0.
+
+    'order(depth, edges)' sorts each new level, which is the order children get
+    numbered in; by default they're sorted by id. 'choose(edge, candidates)' picks an
+    edge's parent from the edges of the previous level it touches, in the order that
+    level was sorted; by default the first. Stops after 'max_depth' levels.
+
+    Returns (parent, levels): the parent of every edge reached, None for the roots,
+    and the list of edges at each level, in order.'''
+    parent = dict((edge_id, None) for edge_id in roots)
+    found = [list(roots)]
+    while found[-1] and (max_depth is None or len(found) <= max_depth):
+      candidates = {}
+      for edge_id in found[-1]:
+        for other in self.neighbors(edge_id):
+          if other not in parent:
+            candidates.setdefault(other, []).append(edge_id)
+      level = order(len(found), list(candidates)) if order else sorted(candidates)
+      for edge_id in level:
+        touching = candidates[edge_id]
+        parent[edge_id] = choose(edge_id, touching) if choose else touching[0]
+      found.append(level)
+    if not found[-1]:
+      found.pop()
+    return parent, found
+
+  def tree_of_nodes(self, roots):
+    '''For every node reachable from the root edges, the index in 'roots' of the
+    root edge of its tree'''
+    tree = {}
+    queue = []
+    for index, edge_id in enumerate(roots):
+      for node in self.edges[edge_id]:
+        if node not in tree:
+          tree[node] = index
+          queue.append(node)
+    for node in queue:
+      for edge_id in self.touching[node]:
+        for other in self.edges[edge_id]:
+          if other not in tree:
+            tree[other] = tree[node]
+            queue.append(other)
+    return tree
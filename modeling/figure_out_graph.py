@@ -5,6 +5,7 @@ import math
 import pprint
 import json
 import sys
+import point_merge
 
 number_of_roots = 6
 minimum_rod_length = 17 # inches
@@ -80,26 +81,7 @@ if add_extra_rod_under_roots:
   data = root_rods + data
 
 # each neighborhood is a list of points that will get merged into a single node
-neighborhoods = []
-
-def find_neighborhood(p):
-  found_neighborhood = None
-  for neighborhood in neighborhoods:
-    if found_neighborhood:
-      break
-    for neighbor in neighborhood:
-      if distance_between(neighbor, p) < point_merge_proximity:
-        found_neighborhood = neighborhood
-        break
-  if not found_neighborhood:
-    found_neighborhood = []
-    neighborhoods.append(found_neighborhood)
-  found_neighborhood.append(p)
-
-# sort each point into a neighborhood
-for p1,p2 in data:
-  find_neighborhood(p1)
-  find_neighborhood(p2)
+neighborhoods = point_merge.neighborhoods([p for rod in data for p in rod], point_merge_proximity)
 
 
 if use_kludge_for_MA_Final:
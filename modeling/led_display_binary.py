@@ -3,6 +3,7 @@ import opc_client
 import json
 import sys
 import time
+import numpy
 
 # Tests the semantic mapping of LEDs from manual.remap.json
 # Usage: ./led_display_binary 127.0.0.1:7890
@@ -26,13 +27,10 @@ socket = opc_client.get_socket(server)
 
 while True:
   for x in reversed(range(8)):
-    pixels = [(0,0,0)] * led_count
+    pixels = numpy.zeros((led_count, 3), dtype=numpy.uint8)
     bit = 2 ** x
     print(bit)
-    color = colors[bit]
-    for i in range(led_count):
-      if i & bit:
-        pixels[i] = color
+    pixels[numpy.arange(led_count) & bit != 0] = colors[bit]
 
     opc_client.put_pixels(socket, 0, pixels)
     time.sleep(3)
@@ -5,6 +5,7 @@ import math
 import sys
 import itertools
 import colorsys
+import numpy
 
 import opc_client
 
@@ -46,23 +47,15 @@ snake_length = 20
 snake_head = 0
 fps = 2
 
-for tick in itertools.count():
-    pixels = []
-    for index in range(n_pixels):
-        snake_pos = snake_head - index
-
-        hue = 0
-        saturation = 0
-        value = 0
-
-        if snake_pos >= 0 and snake_pos < snake_length:
-          hue = (5.0/6.0) * snake_pos / snake_length
-          saturation = 1
-          value = 1
+# the snake's colors never change, only where it is
+snake = numpy.array([colorsys.hsv_to_rgb((5.0/6.0) * pos / snake_length, 1, 1)
+                     for pos in range(snake_length)])
+snake = opc_client.remap(snake, 0.0, 1.0, 0, 255)
 
-        r, g, b = map(lambda x:opc_client.remap(x,0.0,1.0,0,255), colorsys.hsv_to_rgb(hue, saturation, value))
-
-        pixels.append((r, g, b))
+for tick in itertools.count():
+    pixels = numpy.zeros((n_pixels, 3))
+    # pixel index is snake_head - snake_pos
+    pixels[snake_head - numpy.arange(min(snake_length, snake_head + 1))] = snake[:snake_head + 1]
     opc_client.put_pixels(SOCK, 0, pixels)
     time.sleep(1 / fps)
     snake_head += 1
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 import opc_client
 import json
+import os
 import sys
+import numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from led.addresses import AddressIndex
 
 # Tests the semantic mapping of LEDs from manual.remap.json
 # Usage: ./led_test_branch.py manual.remap.json *.1.1.1 127.0.0.1:7890
@@ -10,45 +15,25 @@ remap_data = json.load(open(sys.argv[1]))
 target = sys.argv[2]
 server = sys.argv[3] if len(sys.argv) > 3 else '127.0.0.1:7890'
 
-def matches(target, addr, partial = False):
-  target_parts = target.split('.')
-  addr_parts = addr.split('.')
-  for target_part, addr_part in zip(target_parts, addr_parts):
-    if target_part != '*' and target_part != addr_part:
-      return False
-  if len(target_parts) == len(addr_parts):
-    return True
-  if len(target_parts) < len(addr_parts):
-    return partial
-  return False
-
-
-exact_matching_addresses = [addr for addr in remap_data if matches(target,addr)]
-child_matching_addresses = [addr for addr in remap_data if matches(target,addr, True) and addr not in exact_matching_addresses]
-parent_matching_addresses = [addr for addr in remap_data if [True for exact in exact_matching_addresses if matches(addr, exact, True)] and not addr in exact_matching_addresses]
+index = AddressIndex.fromMapping(remap_data)
 
-#print(exact_matching_addresses)
-#print(child_matching_addresses)
-#print(parent_matching_addresses)
+exact_matching = index.match(target)
+# descendants and ancestors of the matching addresses, excluding the matches themselves
+child_matching = index.match(target, partial=True) & ~exact_matching
+parent_matching = index.ancestors(exact_matching) & ~exact_matching
 
-exact_matching_leds = [ int(remap_data[addr]) for addr in exact_matching_addresses ]
+exact_matching_leds = index.edges(exact_matching).tolist()
 print(exact_matching_leds)
-child_matching_leds = [ int(remap_data[addr]) for addr in child_matching_addresses ]
-parent_matching_leds = [ int(remap_data[addr]) for addr in parent_matching_addresses ]
+child_matching_leds = index.edges(child_matching).tolist()
+parent_matching_leds = index.edges(parent_matching).tolist()
 print(parent_matching_leds)
 
-pixel_count = max([int(remap_data[k]) for k in remap_data ]) + 1
-
-pixels = [(0,0,0)] * pixel_count
-
-for n in exact_matching_leds:
-  pixels[n] = (255,255,255)
-
-for n in child_matching_leds:
-  pixels[n] = (0,255,100)
+pixel_count = index.numEdges
 
-for n in parent_matching_leds:
-  pixels[n] = (255,0,0)
+pixels = numpy.zeros((pixel_count, 3), dtype=numpy.uint8)
+pixels[exact_matching_leds] = (255,255,255)
+pixels[child_matching_leds] = (0,255,100)
+pixels[parent_matching_leds] = (255,0,0)
 
 socket = opc_client.get_socket(server)
 opc_client.put_pixels(socket, 0, pixels)
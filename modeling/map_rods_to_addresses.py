@@ -31,18 +31,7 @@ import json
 # with q as an import.
 from pprint import pprint
 
-# Functions
-def edge_is_root(edge_id, edges):
-    edge_bottom_node = edges[edge_id][0]
-    for test_id, test_nodes in edges.iteritems():
-        if edge_id == test_id:
-            continue
-        if test_nodes[1] == edge_bottom_node:
-            return False
-
-    # made it this far, so it must be a root node!
-    return True
-
+import edge_graph
 
 # File input
 args = sys.argv[1:]
@@ -57,13 +46,14 @@ except:
 
 infile_json = json.load(infile)
 infile_edges = infile_json['edges']
+graph = edge_graph.EdgeGraph(infile_edges)
 outfile_edges = {}
 root_edge_ids = []
 branch_edge_ids = []
 
 # split up edges into roots and branches
 for edge_id, nodes in infile_edges.iteritems():
-    if edge_is_root(edge_id, infile_edges):
+    if graph.is_root(edge_id):
         root_edge_ids.append(edge_id)
     else:
         branch_edge_ids.append(edge_id)
@@ -93,17 +83,19 @@ while len(outfile_edges.keys()) < len(infile_edges.keys()):
         # add an outfile edge that uses some of the parent's info
         # increment the parent's child count
         # continue
-        known_edges = outfile_edges.keys()
+        # Every pass links each branch again, to every parent it has, in the order
+        # outfile_edges lists them. That order only matters when there's more than one.
+        known_edges = [edge_id for edge_id in graph.parents(branch_edge_id) if edge_id in outfile_edges]
+        if len(known_edges) > 1:
+            known_edges = [edge_id for edge_id in outfile_edges.keys() if edge_id in known_edges]
         for edge_id in known_edges:
-            if infile_edges[branch_edge_id][0] == infile_edges[edge_id][1]:
-                metadata = outfile_edges[edge_id]
-                outfile_edges[branch_edge_id] = {
-                    'num_children': 0,
-                    'tree': metadata['tree'],
-                    'level': metadata['level'] + 1,
-                    'index': metadata['num_children'] + 1
-                }
-                metadata['num_children'] += 1
-                continue
+            metadata = outfile_edges[edge_id]
+            outfile_edges[branch_edge_id] = {
+                'num_children': 0,
+                'tree': metadata['tree'],
+                'level': metadata['level'] + 1,
+                'index': metadata['num_children'] + 1
+            }
+            metadata['num_children'] += 1
 
 pprint(outfile_edges)
\ No newline at end of file
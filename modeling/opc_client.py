@@ -32,6 +32,8 @@ Also includes some helper functions to make color manipulations easier:
 import math
 import socket
 
+import numpy
+
 
 #-------------------------------------------------------------------------------
 # Communication with Open Pixel Control servers
@@ -57,31 +59,38 @@ def put_pixels(sock, channel, pixels):
         Must be an int in the range 0-255 inclusive.
         0 is a special value which means "all strands".
 
-    pixels: A list of 3-tuples representing rgb colors.
+    pixels: A list of 3-tuples representing rgb colors, or an N x 3 numpy array.
         Each value in the tuple should be in the range 0-255 inclusive. 
         For example, [(255, 255, 255), (0, 0, 0), (127, 0, 0)]
         Floats will be rounded down to integers.
         Values outside the legal range will be clamped.
+        A C-contiguous uint8 array is sent straight from its own memory, with
+        no conversion or copy.
 
     A socket.error exception will occur if the connection fails.
 
     """
-    len_hi_byte = int(len(pixels)*3 / 256)
-    len_lo_byte = (len(pixels)*3) % 256
-    header = chr(channel) + chr(0) + chr(len_hi_byte) + chr(len_lo_byte)
-    pieces = [header]
-    for r, g, b in pixels:
-        r = min(255, max(0, int(r)))
-        g = min(255, max(0, int(g)))
-        b = min(255, max(0, int(b)))
-        pieces.append(chr(r) + chr(g) + chr(b))
-    command = ''.join(pieces)
-    sock.send(command)
+    pixels = numpy.asarray(pixels)
+    count = pixels.size // 3
+    header = bytearray((channel, 0, (count * 3) // 256, (count * 3) % 256))
+    if pixels.dtype == numpy.uint8 and pixels.flags.c_contiguous:
+        sock.sendall(header)
+        if count:
+            sock.sendall(buffer(pixels, 0, count * 3))
+        return
+    packet = header + bytearray(count * 3)
+    if count:
+        data = numpy.frombuffer(packet, dtype=numpy.uint8, offset=4)
+        data[:] = numpy.clip(pixels.reshape(-1)[:count * 3], 0, 255)
+    sock.sendall(packet)
 
 
 #-------------------------------------------------------------------------------
 # Helper functions to make common color manipulations easier
 
+def _is_array(x):
+    return isinstance(x, numpy.ndarray)
+
 def remap(x, oldmin, oldmax, newmin, newmax):
     """Remap the float x from the range oldmin-oldmax to the range newmin-newmax
 
@@ -89,12 +98,22 @@ def remap(x, oldmin, oldmax, newmin, newmax):
     For example, to make a sine wave that goes between 0 and 255:
         remap(math.sin(time.time()), -1, 1, 0, 256)
 
+    x can also be a tuple, which gives a tuple back, or an array of any shape,
+    which is worked on as floats so integer arrays can't wrap around.
+
     """
+    if isinstance(x, tuple):
+        return tuple(remap(v, oldmin, oldmax, newmin, newmax) for v in x)
+    if _is_array(x):
+        x = numpy.asarray(x, dtype=float)
     zero_to_one = (x-oldmin) / (oldmax-oldmin)
     return zero_to_one*(newmax-newmin) + newmin
 
 def clamp(x, minn, maxx):
-    """If float x is outside the range minn-maxx, return minn or maxx."""
+    """If float x is outside the range minn-maxx, return minn or maxx.
+    Clamps every value of an array."""
+    if _is_array(x):
+        return numpy.clip(x, minn, maxx)
     return max(minn, min(maxx, x))
 
 def cos(x, offset=0, period=1, minn=0, maxx=1):
@@ -103,18 +122,26 @@ def cos(x, offset=0, period=1, minn=0, maxx=1):
     offset: how much to slide the curve across the domain.
     period: the length of one wave
     minn, maxx: the output range
+    x may be an array.
     """
-    value = math.cos((x/period - offset) * math.pi * 2) / 2 + 0.5
+    if _is_array(x):
+        value = numpy.cos((x/period - offset) * math.pi * 2) / 2 + 0.5
+    else:
+        value = math.cos((x/period - offset) * math.pi * 2) / 2 + 0.5
     return value*(maxx-minn) + minn
 
 def contrast(color, center, mult):
     """Expand the color values by a factor of mult around the pivot value of center.
 
-    color: an (r, g, b) tuple
+    color: an (r, g, b) tuple, or an N x 3 array of colors
     center: a float -- the fixed point
     mult: a float -- expand or contract the values around the center point
 
+    Arrays are worked on as floats, so a uint8 frame doesn't wrap around.
+
     """
+    if _is_array(color):
+        return (numpy.asarray(color, dtype=float) - center) * mult + center
     r, g, b = color
     r = (r - center) * mult + center
     g = (g - center) * mult + center
@@ -124,10 +151,12 @@ def contrast(color, center, mult):
 def clip_black_by_luminance(color, threshold):
     """If the color's luminance is less than threshold, replace it with black.
     
-    color: an (r, g, b) tuple
+    color: an (r, g, b) tuple, or an N x 3 array of colors
     threshold: a float
 
     """
+    if _is_array(color):
+        return numpy.where(color.sum(axis=-1)[..., numpy.newaxis] < threshold*3, 0, color)
     r, g, b = color
     if r+g+b < threshold*3:
         return (0, 0, 0)
@@ -136,10 +165,12 @@ def clip_black_by_luminance(color, threshold):
 def clip_black_by_channels(color, threshold):
     """Replace any r, g, or b value less than threshold with 0.
 
-    color: an (r, g, b) tuple
+    color: an (r, g, b) tuple, or an N x 3 array of colors
     threshold: a float
 
     """
+    if _is_array(color):
+        return numpy.where(color < threshold, 0, color)
     r, g, b = color
     if r < threshold: r = 0
     if g < threshold: g = 0
@@ -149,16 +180,20 @@ def clip_black_by_channels(color, threshold):
 def mod_dist(a, b, n):
     """Return the distance between a and b, modulo n.
 
-    a and b can be floats or integers.
+    a and b can be floats or integers, or arrays of them.
 
     For example, thinking of a clock:
     mod_dist(11, 1, 12) == 2 because you can "wrap around".
 
     """
+    if _is_array(a) or _is_array(b):
+        return numpy.minimum((a-b) % n, (b-a) % n)
     return min((a-b) % n, (b-a) % n)
 
 def gamma(color, gamma):
-    """Apply a gamma curve to the color.  The color values should be in the range 0-1."""
+    """Apply a gamma curve to the color.  The color values should be in the range 0-1.
+    color may be an (r, g, b) tuple or an N x 3 array of colors."""
+    if _is_array(color):
+        return numpy.maximum(color, 0) ** gamma
     r, g, b = color
     return (max(r,0) ** gamma, max(g,0) ** gamma, max(b,0) ** gamma)
-
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+'''Builds the sculpture model from rod_endpoints.txt, redoing only what's changed.
+
+Each step of the old make.sh is a stage, with the files it reads and writes. Stages
+run in dependency order. A stage is skipped when the contents of its inputs, its
+script and its parameters hash the same as last time and its outputs are still what
+it wrote, which is recorded in .pipeline.json. A stage whose output comes out the
+same as before doesn't make the stages after it rerun.
+
+The last stage builds the led.Model and writes the cache it loads at startup,
+graph.data.cache.npz, so the first run of the animation doesn't have to.
+
+Usage: python pipeline.py [--scoot] [--force] [--dry-run] [stage ...]
+
+rod_endpoints.txt has to be exported from Rhino by hand first: Tools > Command >
+Search..., RunPythonScript, select exportRodEndpoints.py in the first dialog and
+rod_endpoints.txt in the second.
+'''
+
+from __future__ import print_function
+import argparse
+import distutils.spawn
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MANIFEST = os.path.join(HERE, '.pipeline.json')
+MANIFEST_VERSION = 1
+
+sys.path.insert(0, ROOT)
+from led.model import cacheFilenameFor
+
+
+class Stage(object):
+  '''One step of the build. 'run' is called with the stage and writes 'outputs'
+  from 'inputs', paths relative to the modeling directory. Anything else that
+  changes the result goes in 'params'.'''
+
+  def __init__(self, name, inputs, outputs, run, params=None):
+    self.name = name
+    self.inputs = inputs
+    self.outputs = outputs
+    self.run = run
+    self.params = params or {}
+
+  def key(self, hashes):
+    digest = hashlib.sha1(json.dumps([self.name, self.params], sort_keys=True))
+    for path in self.inputs:
+      digest.update(path + '\0' + hashes[path] + '\0')
+    return digest.hexdigest()
+
+
+def file_hash(path):
+  with open(os.path.join(HERE, path), 'rb') as f:
+    return hashlib.sha1(f.read()).hexdigest()
+
+
+def write_atomically(path, data):
+  temp = os.path.join(HERE, path + '.tmp')
+  with open(temp, 'wb') as f:
+    f.write(data)
+  os.rename(temp, os.path.join(HERE, path))
+
+
+def script(name, *args):
+  '''Runs a modeling script with 'args', saving what it prints to the stage's only
+  output, or if there's no output file to print to, passing it through'''
+  def run(stage):
+    output = subprocess.check_output([sys.executable, name] + list(args), cwd=HERE)
+    if len(stage.outputs) == 1 and stage.outputs[0] not in args:
+      write_atomically(stage.outputs[0], output)
+    else:
+      sys.stdout.write(output)
+  return run
+
+
+def copy(stage):
+  shutil.copyfile(os.path.join(HERE, stage.inputs[0]), os.path.join(HERE, stage.outputs[0]))
+
+
+def build_model(stage):
+  from led.model import Model
+  graph, mapping = [os.path.join(HERE, p) for p in stage.inputs[:2]]
+  Model(graph, mapping, cache=False).saveCache(os.path.join(HERE, stage.outputs[0]))
+
+
+def graphviz(stage):
+  output = subprocess.check_output([sys.executable, 'graphvizify.py'], cwd=HERE)
+  write_atomically('graph.dot', output)
+  subprocess.check_call(['dot', '-T', 'png', '-o', 'graph.png', 'graph.dot'], cwd=HERE)
+  subprocess.check_call(['neato', '-T', 'png', '-o', 'graph2.png', 'graph.dot'], cwd=HERE)
+
+
+def stages(scoot=False):
+  model_code = ['../led/%s.py' % m for m in ('model', 'addresses', 'spatial', 'topology')]
+  found = [
+    Stage('figure_out_graph',
+          ['figure_out_graph.py', 'point_merge.py', 'rod_endpoints.txt'],
+          ['graph.unmapped.data.json'],
+          script('figure_out_graph.py', 'rod_endpoints.txt')),
+    Stage('assign_rod_addresses',
+          ['assign_rod_addresses.py', 'edge_graph.py', 'graph.unmapped.data.json'],
+          ['rod_addresses.json'],
+          script('assign_rod_addresses.py', 'graph.unmapped.data.json')),
+    # scooting is off unless asked for, until someone figures out what it's doing
+    Stage('scoot_trees',
+          ['scoot_trees.py', 'edge_graph.py', 'graph.unmapped.data.json'] if scoot else ['graph.unmapped.data.json'],
+          ['graph.scooted.data.json'],
+          script('scoot_trees.py', 'graph.unmapped.data.json') if scoot else copy,
+          {'scoot': scoot}),
+    Stage('shunt',
+          ['shunt.py', 'manual.remap.json'],
+          ['shunted.remap.json'],
+          script('shunt.py', 'manual.remap.json')),
+    Stage('remap',
+          ['remap_graph_edges_to_physical_leds.py', 'graph.scooted.data.json', 'rod_addresses.json', 'shunted.remap.json'],
+          ['graph.data.json'],
+          script('remap_graph_edges_to_physical_leds.py', 'graph.scooted.data.json', 'rod_addresses.json', 'shunted.remap.json')),
+    Stage('graph_to_layout',
+          ['graph_to_layout.py', 'graph.data.json'],
+          ['opc-layout.json'],
+          script('graph_to_layout.py', 'graph.data.json', 'opc-layout.json')),
+    Stage('model',
+          ['graph.data.json', 'manual.remap.json'] + model_code,
+          [cacheFilenameFor('graph.data.json')],
+          build_model),
+  ]
+  if distutils.spawn.find_executable('dot'):
+    found.append(Stage('graphviz',
+                       ['graphvizify.py', 'graph.data.json', 'manual.remap.json'],
+                       ['graph.dot', 'graph.png', 'graph2.png'],
+                       graphviz))
+  else:
+    print("HEY: install graphviz to produce graph.png")
+  return found
+
+
+def in_order(all_stages, targets=None):
+  '''The stages needed for 'targets' (stage names, default all), dependencies first'''
+  producer = dict((output, stage) for stage in all_stages for output in stage.outputs)
+  by_name = dict((stage.name, stage) for stage in all_stages)
+  ordered = []
+  visiting = set()
+
+  def visit(stage):
+    if stage in ordered:
+      return
+    if stage in visiting:
+      raise ValueError("Stage %s depends on itself" % stage.name)
+    visiting.add(stage)
+    for path in stage.inputs:
+      if path in producer:
+        visit(producer[path])
+    visiting.discard(stage)
+    ordered.append(stage)
+
+  for name in targets or [stage.name for stage in all_stages]:
+    if name not in by_name:
+      raise ValueError("No stage called %s" % name)
+    visit(by_name[name])
+  return ordered
+
+
+def build(targets=None, scoot=False, force=False, dry_run=False):
+  '''Runs whatever is out of date. Returns the names of the stages that ran.'''
+  try:
+    manifest = json.load(open(MANIFEST))
+    if manifest.get('version') != MANIFEST_VERSION:
+      manifest = {}
+  except (IOError, ValueError):
+    manifest = {}
+  records = manifest.get('stages', {})
+
+  hashes = {}
+  ran = []
+  for stage in in_order(stages(scoot), targets):
+    for path in stage.inputs:
+      if path not in hashes:
+        hashes[path] = file_hash(path)
+    key = stage.key(hashes)
+    record = records.get(stage.name)
+    current = (not force and record and record['key'] == key and
+               all(os.path.exists(os.path.join(HERE, p)) and file_hash(p) == record['outputs'].get(p)
+                   for p in stage.outputs))
+    if current:
+      print("  %-22s up to date" % stage.name)
+    elif dry_run:
+      print("  %-22s would run" % stage.name)
+      record = {'outputs': dict((p, 'out of date') for p in stage.outputs)}
+    else:
+      start = time.time()
+      stage.run(stage)
+      record = {'key': key, 'outputs': dict((p, file_hash(p)) for p in stage.outputs)}
+      records[stage.name] = record
+      with open(MANIFEST, 'w') as f:
+        f.write(json.dumps({'version': MANIFEST_VERSION, 'stages': records},
+                           sort_keys=True, indent=4, separators=(',', ': ')))
+      print("  %-22s ran in %.3f s" % (stage.name, time.time() - start))
+      ran.append(stage.name)
+    hashes.update(record['outputs'])
+  return ran
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Incremental build of the sculpture model from rod_endpoints.txt")
+  parser.add_argument('targets', nargs='*', help="stages to bring up to date, with what they need (default all)")
+  parser.add_argument('--scoot', action='store_true', help="scoot the trees toward the middle")
+  parser.add_argument('--force', action='store_true', help="rerun stages even if they look up to date")
+  parser.add_argument('--dry-run', '-n', action='store_true', help="only say what would run")
+  args = parser.parse_args()
+
+  start = time.time()
+  build(args.targets, args.scoot, args.force, args.dry_run)
+  print("Done in %.3f s" % (time.time() - start))
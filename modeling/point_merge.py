@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# Groups rod endpoints that are close together into the neighborhoods that become the
+# nodes of the graph.
+#
+# Points go into a grid of cubes as wide as the merge distance, so any two points close
+# enough to merge are in the same cube or neighboring ones, and only those pairs get
+# measured. Close pairs are then joined into connected components, union-find style:
+# every point takes the smallest label among its close neighbors, and labels are
+# followed to their own labels, until nothing changes. All of it is done on whole
+# arrays, so 100k rods take about a second instead of minutes.
+#
+# python point_merge.py [rods] benchmarks it on a synthetic sculpture.
+
+from __future__ import print_function
+import itertools
+import math
+import sys
+import time
+
+import numpy
+
+# Offsets to the neighboring cells, one of each opposite pair, plus the cell itself
+HALF_NEIGHBORHOOD = [o for o in itertools.product((-1, 0, 1), repeat=3) if o >= (0, 0, 0)]
+
+
+def close_pairs(points, proximity):
+  '''Indices (i, j), i < j, of every pair of points less than 'proximity' apart'''
+  n = len(points)
+  cells = numpy.floor(points / proximity).astype(numpy.int64)
+  cells -= cells.min(axis=0) - 1            # leave room for the -1 offsets
+  dims = cells.max(axis=0) + 2
+  keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+  order = numpy.argsort(keys, kind='mergesort')
+  cell_keys, starts, counts = numpy.unique(keys[order], return_index=True, return_counts=True)
+
+  found_i = []
+  found_j = []
+  for dx, dy, dz in HALF_NEIGHBORHOOD:
+    other = cell_keys + (dx * dims[1] + dy) * dims[2] + dz
+    b = numpy.minimum(numpy.searchsorted(cell_keys, other), len(cell_keys) - 1)
+    a = numpy.nonzero(cell_keys[b] == other)[0]
+    b = b[a]
+    # every point of cell a against every point of cell b
+    sizes = counts[a] * counts[b]
+    pair_cell = numpy.repeat(numpy.arange(len(a)), sizes)
+    within = numpy.arange(sizes.sum()) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+    width = counts[b][pair_cell]
+    i = order[starts[a][pair_cell] + within // width]
+    j = order[starts[b][pair_cell] + within % width]
+    if (dx, dy, dz) == (0, 0, 0):
+      keep = i < j
+      i, j = i[keep], j[keep]
+    d = points[i] - points[j]
+    close = numpy.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1] + d[:, 2] * d[:, 2]) < proximity
+    found_i.append(i[close])
+    found_j.append(j[close])
+  i = numpy.concatenate(found_i)
+  j = numpy.concatenate(found_j)
+  return numpy.minimum(i, j), numpy.maximum(i, j)
+
+
+def merge_labels(points, proximity):
+  '''For each point, the index of the first point in its neighborhood'''
+  points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+  labels = numpy.arange(len(points))
+  if not len(points):
+    return labels
+  i, j = close_pairs(points, proximity)
+  while True:
+    merged = labels.copy()
+    numpy.minimum.at(merged, i, labels[j])
+    numpy.minimum.at(merged, j, labels[i])
+    merged = merged[merged]
+    if (merged == labels).all():
+      return labels
+    labels = merged
+
+
+def neighborhoods(points, proximity):
+  '''Lists of points less than 'proximity' from another in the same list, chained.
+  Lists are in order of their first point, and points keep their order within each.'''
+  labels = merge_labels(points, proximity)
+  if not len(labels):
+    return []
+  order = numpy.argsort(labels, kind='mergesort')
+  bounds = numpy.nonzero(numpy.diff(labels[order]))[0] + 1
+  return [[points[k] for k in group] for group in numpy.split(order, bounds)]
+
+
+def distance_between(p1, p2):
+  return math.sqrt(sum((x - y) * (x - y) for x, y in zip(p1, p2)))
+
+
+def greedy_neighborhoods(points, proximity):
+  '''The old way: each point joins the first neighborhood with a point close to it'''
+  found = []
+  for p in points:
+    for neighborhood in found:
+      if any(distance_between(neighbor, p) < proximity for neighbor in neighborhood):
+        neighborhood.append(p)
+        break
+    else:
+      found.append([p])
+  return found
+
+
+def synthesize_rods(count, seed=1, spacing=18.0, jitter=0.5):
+  '''Endpoints of 'count' rods joining random nodes of a jittered lattice, like the
+  sculpture's joints, so several rods meet at each node'''
+  rng = numpy.random.RandomState(seed)
+  side = int(math.ceil((count / 3.0) ** (1 / 3.0))) + 1
+  nodes = rng.randint(0, side, (count, 3))
+  steps = numpy.eye(3, dtype=int)[rng.randint(0, 3, count)]
+  ends = numpy.minimum(nodes + steps, side - 1)
+  points = numpy.empty((count, 2, 3))
+  points[:, 0] = nodes * spacing + rng.uniform(-jitter, jitter, (count, 3))
+  points[:, 1] = ends * spacing + rng.uniform(-jitter, jitter, (count, 3))
+  return points.reshape(-1, 3)
+
+
+if __name__ == '__main__':
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+  points = synthesize_rods(count)
+  start = time.time()
+  found = neighborhoods([tuple(p) for p in points], 3.0)
+  elapsed = time.time() - start
+  print("%d rods, %d endpoints, %d neighborhoods in %.2f s" % (count, len(points), len(found), elapsed))
+
+  sample = [tuple(p) for p in synthesize_rods(1000)]
+  start = time.time()
+  old = greedy_neighborhoods(sample, 3.0)
+  elapsed = time.time() - start
+  print("1000 rods the old way: %.2f s, same result: %s" % (elapsed, old == neighborhoods(sample, 3.0)))
@@ -5,6 +5,7 @@ import math
 import pprint
 import json
 import sys
+import edge_graph
 
 f = open(sys.argv[1])
 data = json.load(f)
@@ -16,20 +17,7 @@ edge_by_id = { int(index): value for index,value in data["edges"].items() }
 node_by_id = { int(index): value for index,value in data["nodes"].items() }
 
 root_edges = [edge_by_id[i] for i in range(number_of_roots)]
-def find_root_for_node(node, skip = None ):
-  if not skip:
-    skip = set()
-  skip.update(set([node]))
-  for index, edge in enumerate(root_edges):
-    if node in edge:
-      return index
-  for edge_index, edge in edge_by_id.items():
-    if node in edge:
-      other_nodes = [n for n in edge if n not in skip]
-      for other_node in other_nodes:
-        r = find_root_for_node(other_node, skip)
-        if r != None:
-          return r
+tree_of_node = edge_graph.EdgeGraph(edge_by_id).tree_of_nodes(range(number_of_roots))
 
 scoot_tree_by = []
 for edge in root_edges:
@@ -40,7 +28,7 @@ for edge in root_edges:
   y2 = (r - scoot_to_new_distance) * math.sin(theta)
   scoot_tree_by.append( (-x2,-y2) )
 for index, node in node_by_id.items():
-  root_index = find_root_for_node(index)
+  root_index = tree_of_node[index]
   (dx, dy) = scoot_tree_by[root_index]
   (x,y,z) = node
   node2 = (x+dx, y+dy, z)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""Generates synthetic branching-tree sculptures, for testing effects at sizes
+we haven't built yet.
+
+Writes a graph JSON file and an address mapping file in the same formats as
+graph.data.json and manual.remap.json, so the output can be loaded directly by
+led.model.Model:
+
+  - graph: {"nodes": {"0": [x, y, z], ...}, "edges": {"0": [n1, n2], ...}}
+    where edge keys are LED indices
+  - mapping: {"1": 0, "1.1": 1, "1.1.1": 2, ...} from dotted address to LED index
+
+Each tree starts with a short vertical root rod (address "t"), and every rod
+below the top level has 'fanout' children ("t.1", "t.2", ...), up to 'depth'
+address levels. LEDs are numbered depth-first along each tree, like a strand
+wired up one branch after another.
+
+Usage: ./synthesize_sculpture.py graph.json remap.json [trees] [depth] [fanout] [seed]
+   or: ./synthesize_sculpture.py graph.json remap.json --edges 100000
+"""
+
+import json
+import math
+import random
+import sys
+
+branch_length = 20.0 # inches, roughly one rod
+tree_spacing = 40.0 # inches from the center of the sculpture to each tree
+elevation = math.pi / 4 # how steeply branches climb
+spread = math.pi / 2 # angle covered by the children of a first-level branch
+spread_falloff = 0.7 # each level's children fan out a bit less than their parent's
+jitter = 0.1 # radians of random wobble on each branch
+
+
+def edge_count(trees, depth, fanout):
+  """Number of edges (LEDs) in a sculpture with these parameters"""
+  per_tree = depth if fanout == 1 else (fanout ** depth - 1) // (fanout - 1)
+  return trees * per_tree
+
+def parameters_for_edge_count(edges, fanout=2, min_trees=6):
+  """(trees, depth, fanout) for a sculpture with roughly 'edges' edges.
+
+  Grows the trees as deep as they'll go with at least min_trees of them, then
+  adds trees to get close to the requested count.
+  """
+  depth = 2
+  while edge_count(min_trees, depth + 1, fanout) <= edges:
+    depth += 1
+  trees = max(1, int(round(float(edges) / edge_count(1, depth, fanout))))
+  return trees, depth, fanout
+
+def generate(trees=6, depth=7, fanout=2, seed=0):
+  """Returns (graph, mapping) dictionaries ready to be written as JSON"""
+  if depth < 2:
+    raise ValueError("Sculptures need a depth of at least 2")
+  rng = random.Random(seed)
+
+  # led.model.Model treats edges centered in the bottom tenth of the sculpture as
+  # roots, so keep the root rods short relative to the total height.
+  rise = branch_length * math.sin(elevation)
+  run = branch_length * math.cos(elevation)
+  root_length = 0.1 * rise * (depth - 1)
+
+  nodes = []
+  edges = []
+  mapping = {}
+
+  def add_node(point):
+    nodes.append([round(v, 6) for v in point])
+    return len(nodes) - 1
+
+  for tree in range(trees):
+    azimuth = 2 * math.pi * tree / trees
+    radius = tree_spacing if trees > 1 else 0
+    base = (radius * math.cos(azimuth), radius * math.sin(azimuth), 0.0)
+    top = (base[0], base[1], root_length)
+
+    # Depth-first, so each branch's LEDs are numbered contiguously
+    stack = [(str(tree + 1), add_node(base), top, azimuth, 0)]
+    while stack:
+      address, start_node, end_point, heading, level = stack.pop()
+      end_node = add_node(end_point)
+      mapping[address] = len(edges)
+      edges.append([start_node, end_node])
+
+      if level + 1 >= depth:
+        continue
+      # Children all start at this rod's top node, fanned out around its heading
+      child_spread = spread * spread_falloff ** level
+      children = []
+      for i in range(fanout):
+        offset = (i - (fanout - 1) / 2.0) * child_spread / max(fanout - 1, 1)
+        child_heading = heading + offset + rng.uniform(-jitter, jitter)
+        child_end = (end_point[0] + run * math.cos(child_heading),
+                     end_point[1] + run * math.sin(child_heading),
+                     end_point[2] + rise)
+        children.append(("%s.%d" % (address, i + 1), end_node, child_end, child_heading, level + 1))
+      stack.extend(reversed(children))
+
+  graph = {
+    "nodes": {str(i): point for i, point in enumerate(nodes)},
+    "edges": {str(i): edge for i, edge in enumerate(edges)},
+  }
+  return graph, mapping
+
+def write(graph_filename, mapping_filename, trees=6, depth=7, fanout=2, seed=0):
+  graph, mapping = generate(trees, depth, fanout, seed)
+  with open(graph_filename, 'w') as f:
+    f.write(json.dumps(graph, sort_keys=True, indent=4, separators=(',', ': ')))
+  with open(mapping_filename, 'w') as f:
+    f.write(json.dumps(mapping, sort_keys=True, indent=4, separators=(',', ': ')))
+  return len(graph["edges"])
+
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  if len(args) < 2:
+    sys.exit(__doc__)
+  graph_filename, mapping_filename = args[:2]
+  if len(args) > 3 and args[2] == '--edges':
+    params = parameters_for_edge_count(int(args[3]))
+  else:
+    params = [int(a) for a in args[2:6]]
+  count = write(graph_filename, mapping_filename, *params)
+  sys.stderr.write("Wrote %d edges\n" % count)
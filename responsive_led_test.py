@@ -5,19 +5,20 @@ import time
 import led.effects as effects
 from led.model import Model
 from led.controller import AnimationController, Renderer
-from led.threads import HeadsetThread, FakePulseThread, ParamThread
+from led.runtime import Runtime
+from led.sources import headsetSource, fakePulseSource
+from led.bandpower import BandPowerAnalyzer
 from led.renderer import Renderer
 from mindwave.mindwave import FakeHeadset, BluetoothHeadset 
 
 
-class LayerSwapperThread(ParamThread):
+class LayerSwapper(object):
     """
-    Monitors the headset parameter data and changes the active layers in the renderer
+    Watches the headset parameter data and changes the active layers in the renderer
     when the headset is taken on or off, or when headset data values cross a certain 
     threshold [not implemented yet]
     """
-    def __init__(self, params, renderer):
-        ParamThread.__init__(self, params)
+    def __init__(self, renderer):
         self.renderer = renderer
         self.headsetOn = False
         
@@ -37,19 +38,17 @@ class LayerSwapperThread(ParamThread):
         
         renderer.activeLayers = self.headsetOffLayers
         
-    def run(self):
-        while True:
-            if self.params.eeg and self.params.eeg.on:
-                if not self.headsetOn:
-                    sys.stderr.write("on!\n")
-                    self.headsetOn = True
-                    self.renderer.setFade(0.5, [effects.WhiteOutLayer()], self.headsetOnLayers)
-            else:
-                if self.headsetOn:
-                    sys.stderr.write("off!\n")
-                    self.headsetOn = False
-                    self.renderer.setFade(1, self.headsetOffLayers)
-            time.sleep(0.05)
+    def eegChanged(self, eeg):
+        if eeg and eeg.on:
+            if not self.headsetOn:
+                sys.stderr.write("on!\n")
+                self.headsetOn = True
+                self.renderer.setFade(0.5, [effects.WhiteOutLayer()], self.headsetOnLayers)
+        else:
+            if self.headsetOn:
+                sys.stderr.write("off!\n")
+                self.headsetOn = False
+                self.renderer.setFade(1, self.headsetOffLayers)
                 
                 
 class Pulser(effects.EffectLayer):
@@ -70,13 +69,11 @@ if __name__ == '__main__':
     model = Model('modeling/graph.data.json', 'modeling/manual.remap.json')
     renderer = Renderer()
     
-    pollingThreads = [
-        HeadsetThread(masterParams, BluetoothHeadset()),
-        LayerSwapperThread(masterParams, renderer)
-        #FakePulseThread(controller.params),
-    ]
-    for thread in pollingThreads:
-        thread.start()
+    runtime = Runtime(masterParams)
+    runtime.subscribe('eeg', LayerSwapper(renderer).eegChanged)
+    runtime.spawn(headsetSource(runtime, BluetoothHeadset(), BandPowerAnalyzer()))
+    #runtime.spawn(fakePulseSource(runtime))
+    runtime.start()
         
     time.sleep(0.05)
     controller = AnimationController(model, renderer=renderer, params=masterParams)